@@ -0,0 +1,146 @@
+import os
+import json
+import signal
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+import metrics
+
+
+class FileTimeout(Exception):
+    pass
+
+
+def _on_alarm(signum, frame):
+    raise FileTimeout()
+
+
+def list_pdfs(input_dir):
+    """
+    Returns PDF paths in input_dir, largest first so the long files start
+    early and do not end up as the tail of the run.
+    """
+    paths = [
+        os.path.join(input_dir, name)
+        for name in os.listdir(input_dir)
+        if name.lower().endswith('.pdf')
+    ]
+    return sorted(paths, key=lambda p: (-os.path.getsize(p), p))
+
+
+def output_path_for(pdf_path, output_dir):
+    filename = os.path.splitext(os.path.basename(pdf_path))[0] + '.json'
+    return os.path.join(output_dir, filename)
+
+
+def write_json_atomic(data, path):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def process_one(extract, pdf_path, timeout=None):
+    """
+    Runs extract(pdf_path) and returns (pdf_path, result, error).
+    Exceptions and timeouts are reported instead of raised so one bad file
+    cannot take down the batch.
+    """
+    if timeout:
+        previous = signal.signal(signal.SIGALRM, _on_alarm)
+        signal.alarm(int(timeout))
+    try:
+        return pdf_path, extract(pdf_path), None
+    except FileTimeout:
+        return pdf_path, None, f"timed out after {timeout}s"
+    except Exception as e:
+        return pdf_path, None, f"{type(e).__name__}: {e}"
+    finally:
+        if timeout:
+            signal.alarm(0)
+            signal.signal(signal.SIGALRM, previous)
+
+
+def run_batch(extract, input_dir, output_dir, workers=1, timeout=None):
+    """
+    Extracts every PDF in input_dir with `extract` and writes one JSON per
+    file to output_dir as soon as it is done. `extract` must be a top-level
+    function so it can be sent to worker processes; each worker opens its
+    own document from the path; an extract that writes its own output can
+    return None. Returns the list of (pdf_path, error) for files that
+    failed.
+    """
+    return run_files(extract, list_pdfs(input_dir), output_dir, workers, timeout)
+
+
+def run_files(extract, pdf_paths, output_dir, workers=1, timeout=None):
+    """
+    run_batch over an explicit list of PDF paths. A file whose worker
+    process dies is reported as failed like any other error.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    failures = []
+
+    def handle(pdf_path, result, error):
+        if error:
+            print(f"Failed: {os.path.basename(pdf_path)} -> {error}", file=sys.stderr)
+            failures.append((pdf_path, error))
+        elif result is not None:
+            write_json_atomic(result, output_path_for(pdf_path, output_dir))
+
+    if workers <= 1:
+        for pdf_path in pdf_paths:
+            handle(*process_one(extract, pdf_path, timeout))
+        return failures
+
+    measure = metrics.enabled()
+
+    def submit(pool, pdf_path):
+        if measure:
+            return pool.submit(metrics.measured, process_one, extract, pdf_path, timeout)
+        return pool.submit(process_one, extract, pdf_path, timeout)
+
+    def finish(future):
+        result = future.result()
+        if measure:
+            result, snap = result
+            metrics.merge(snap)
+        handle(*result)
+
+    todo = deque(pdf_paths)
+    while todo:
+        # Only `workers` files are in flight, so when a worker dies (a
+        # crash inside fitz, the OOM killer) the suspects are few
+        suspects = []
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            running = {}
+
+            def fill():
+                while todo and len(running) < workers:
+                    pdf_path = todo.popleft()
+                    running[submit(pool, pdf_path)] = pdf_path
+
+            fill()
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pdf_path = running.pop(future)
+                    try:
+                        finish(future)
+                    except BrokenProcessPool:
+                        suspects.append(pdf_path)
+                if suspects:
+                    # The whole pool is gone; everything in flight was lost
+                    suspects.extend(running.values())
+                    break
+                fill()
+        # Retry the lost files one per fresh process, so only the one that
+        # kills its worker fails; the rest continue in a new pool
+        for pdf_path in suspects:
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                try:
+                    finish(submit(pool, pdf_path))
+                except BrokenProcessPool:
+                    handle(pdf_path, None, "worker process died")
+    return failures
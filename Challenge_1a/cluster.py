@@ -0,0 +1,133 @@
+"""
+Multi-node extraction over a shared filesystem.
+
+A coordinator enqueues the input PDFs into a SQLite work queue, any number
+of workers on any machine that sees the same paths claim and extract them,
+and a final merge publishes the outlines under the same names a
+single-node run of process_pdfs.py would write:
+
+    python cluster.py init   --db /shared/queue.sqlite --input /shared/in --output /shared/out --shards 4
+    python cluster.py worker --db /shared/queue.sqlite [--shard N]     # on each machine, as often as wanted
+    python cluster.py status --db /shared/queue.sqlite
+    python cluster.py merge  --db /shared/queue.sqlite
+
+Workers stage their results in <output>/.parts, so the output directory
+only ever holds outlines of a finished run.
+"""
+import os
+import sys
+import argparse
+from functools import partial
+import work_queue
+from batch import list_pdfs, output_path_for, process_one, write_json_atomic
+from heading_rules import DEFAULT_LEVELS, parse_levels
+from process_pdfs import INPUT_DIR, OUTPUT_DIR, extract_outline_from_pdf, extract_outline_cached, \
+    extractor_fingerprint
+
+
+def staged_path(pdf_path, output_dir):
+    return output_path_for(pdf_path, os.path.join(output_dir, '.parts'))
+
+
+def init(db_path, input_dir, output_dir, shards=1):
+    """
+    Enqueues every PDF in input_dir, largest first, spread over `shards`.
+    Re-running it only adds PDFs that are not queued yet. Paths are stored
+    absolute so workers started elsewhere resolve them the same way.
+    """
+    queue = work_queue.JobQueue(db_path)
+    output_dir = os.path.abspath(output_dir)
+    jobs = [
+        (pdf_path, {'path': pdf_path, 'output': output_dir})
+        for pdf_path in map(os.path.abspath, list_pdfs(input_dir))
+    ]
+    queue.add(jobs, shards)
+    queue.close()
+    print(f"Queued {len(jobs)} PDF(s) in {shards} shard(s)", file=sys.stderr)
+
+
+def handle_job(extract, timeout, payload):
+    pdf_path = payload['path']
+    _, result, error = process_one(extract, pdf_path, timeout)
+    if error:
+        raise RuntimeError(error)
+    os.makedirs(os.path.dirname(staged_path(pdf_path, payload['output'])), exist_ok=True)
+    write_json_atomic(result, staged_path(pdf_path, payload['output']))
+
+
+def merge(db_path):
+    """
+    Moves the staged outlines of finished jobs to their final names.
+    Returns the (key, error) pairs of jobs that did not finish or whose
+    outline is missing. Merging again is harmless.
+    """
+    queue = work_queue.JobQueue(db_path)
+    try:
+        if queue.unfinished():
+            raise RuntimeError(f"{queue.unfinished()} job(s) are still pending or running")
+        incomplete = []
+        for key, payload, state, error in queue.jobs():
+            staged = staged_path(payload['path'], payload['output'])
+            output_path = output_path_for(payload['path'], payload['output'])
+            if state != 'done':
+                incomplete.append((key, error or 'lease expired'))
+            elif os.path.exists(staged):
+                os.replace(staged, output_path)
+            elif not os.path.exists(output_path):
+                incomplete.append((key, f'no staged outline at {staged}'))
+        for output_dir in {payload['output'] for _, payload, _, _ in queue.jobs()}:
+            try:
+                os.rmdir(os.path.join(output_dir, '.parts'))
+            except OSError:
+                pass  # absent, or holds results of jobs that failed
+        return incomplete
+    finally:
+        queue.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract PDF outlines with workers sharing a job queue.")
+    parser.add_argument('command', choices=['init', 'worker', 'status', 'merge'])
+    parser.add_argument('--db', required=True, help="queue database on the shared filesystem")
+    parser.add_argument('--input', default=INPUT_DIR, help="with init, directory containing PDFs")
+    parser.add_argument('--output', default=OUTPUT_DIR, help="with init, directory for JSON outputs")
+    parser.add_argument('--shards', type=int, default=1, help="with init, number of shards")
+    parser.add_argument('--shard', type=int, default=None,
+                        help="with worker, only take jobs from this shard")
+    parser.add_argument('--lease', type=float, default=work_queue.DEFAULT_LEASE,
+                        help="with worker, seconds a job stays claimed without a heartbeat")
+    parser.add_argument('--timeout', type=int, default=None, help="per-file time limit in seconds")
+    parser.add_argument('--levels', type=parse_levels, default=DEFAULT_LEVELS,
+                        help="heading level thresholds in points above body text (default: H1=3,H2=1)")
+    parser.add_argument('--cache-dir', default=None,
+                        help="reuse outlines of unchanged PDFs from this directory")
+    args = parser.parse_args(argv)
+
+    if args.command == 'init':
+        init(args.db, args.input, args.output, args.shards)
+    elif args.command == 'worker':
+        extract = partial(extract_outline_from_pdf, levels=args.levels)
+        if args.cache_dir:
+            extract = partial(extract_outline_cached, extract=extract, cache_dir=args.cache_dir,
+                              cache_fingerprint=extractor_fingerprint(args.levels))
+        done = work_queue.run_worker(args.db, partial(handle_job, extract, args.timeout),
+                                     lease=args.lease, shard=args.shard)
+        print(f"Worker {work_queue.default_owner()} finished {done} job(s)", file=sys.stderr)
+    elif args.command == 'status':
+        queue = work_queue.JobQueue(args.db)
+        work_queue.print_status(queue)
+        queue.close()
+    else:
+        try:
+            incomplete = merge(args.db)
+        except RuntimeError as e:
+            sys.exit(f"Not merged: {e}")
+        for key, error in incomplete:
+            print(f"Failed: {os.path.basename(key)} -> {error}", file=sys.stderr)
+        if incomplete:
+            print(f"{len(incomplete)} file(s) failed", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+import re
+import numpy as np
+
+# Precompiled forms of the per-span checks in process_pdfs.py
+DASHES = re.compile(r'[-_]+')
+NUMBERED = re.compile(r'\d+(\.\d+)*\s+')
+WORDLIKE = re.compile(r'[A-Za-z0-9]{3,}')
+TITLE_KEYWORDS = re.compile(
+    'application|form|grant|advance|report|proposal|certificate'
+    '|request|statement|summary|plan|notice|order|agreement'
+)
+
+# (level, minimum points above the body font size), checked in order;
+# anything below the last threshold gets FALLBACK_LEVEL
+DEFAULT_LEVELS = (('H1', 3), ('H2', 1))
+FALLBACK_LEVEL = 'H3'
+
+
+def parse_levels(text):
+    """
+    Parses "H1=3,H2=1" into level thresholds, highest first.
+    """
+    levels = []
+    for item in text.split(','):
+        name, _, offset = item.partition('=')
+        levels.append((name.strip(), float(offset)))
+    return tuple(sorted(levels, key=lambda level: -level[1]))
+
+
+def block_features(blocks):
+    """
+    Computes the text-dependent heading features of each block once, as
+    arrays: font size, whether the text is long enough and not a rule
+    line, whether it is styled (bold flag, bold font name or all caps)
+    and whether it starts with a section number.
+    """
+    n = len(blocks)
+    sizes = np.fromiter((b.size for b in blocks), dtype=np.float64, count=n)
+    eligible = np.fromiter(
+        (len(b.text) >= 3 and DASHES.fullmatch(b.text) is None for b in blocks), dtype=bool, count=n)
+    styled = np.fromiter(
+        (b.bold or b.text.isupper() or 'bold' in b.font.lower() for b in blocks), dtype=bool, count=n)
+    numbered = np.fromiter((NUMBERED.match(b.text) is not None for b in blocks), dtype=bool, count=n)
+    return sizes, eligible, styled, numbered
+
+
+def heading_mask(features, body_font_size):
+    """
+    Marks the headings among block_features(): at least three characters
+    and not a dash rule, and larger than body text, styled at body size or
+    above, or numbered.
+    """
+    sizes, eligible, styled, numbered = features
+    return eligible & ((sizes > body_font_size) | (styled & (sizes >= body_font_size)) | numbered)
+
+
+def assign_levels(sizes, body_font_size, levels=DEFAULT_LEVELS):
+    """
+    Returns the outline level for each font size.
+    """
+    sizes = np.asarray(sizes, dtype=np.float64)
+    conditions = [sizes >= body_font_size + offset for _, offset in levels]
+    return np.select(conditions, [name for name, _ in levels], default=FALLBACK_LEVEL).tolist()
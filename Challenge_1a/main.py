@@ -2,6 +2,7 @@ import os
 import json
 import fitz  # PyMuPDF
 from collections import Counter, defaultdict
+from pdf_spans import iter_page_spans
 
 INPUT_DIR = '/app/input'
 OUTPUT_DIR = '/app/output'
@@ -15,31 +16,17 @@ def get_font_size_hierarchy(font_sizes):
 
 # Extract headings and title from a PDF
 def extract_outline_from_pdf(pdf_path):
-    doc = fitz.open(pdf_path)
     text_blocks = []
     font_sizes = []
-    for page_num, page in enumerate(doc, 1):
-        blocks = page.get_text("dict")['blocks']
-        for block in blocks:
-            if block['type'] != 0:
-                continue  # skip images, etc.
-            for line in block['lines']:
-                for span in line['spans']:
-                    text = span['text'].strip()
-                    if not text:
-                        continue
-                    font_size = span['size']
-                    font_name = span['font']
-                    is_bold = 'Bold' in font_name or 'bold' in font_name
-                    bbox = span['bbox']
-                    text_blocks.append({
-                        'text': text,
-                        'font_size': font_size,
-                        'is_bold': is_bold,
-                        'page': page_num,
-                        'bbox': bbox
-                    })
-                    font_sizes.append(font_size)
+    with fitz.open(pdf_path) as doc:
+        for page_num, spans in iter_page_spans(doc):
+            for span in spans:
+                text = span.text.strip()
+                if not text:
+                    continue
+                span.text = text
+                text_blocks.append(span)
+                font_sizes.append(span.size)
 
     if not text_blocks:
         return {"title": "", "outline": []}
@@ -55,36 +42,36 @@ def extract_outline_from_pdf(pdf_path):
         h3_size = unique_sizes[2] if len(unique_sizes) > 2 else unique_sizes[-1]
 
     # Extract title: largest text on first page, near top
-    title_candidates = [b for b in text_blocks if b['page'] == 1 and b['font_size'] == h1_size]
+    title_candidates = [b for b in text_blocks if b.page == 1 and b.size == h1_size]
     if title_candidates:
         # Prefer text near the top of the page
-        title = sorted(title_candidates, key=lambda b: b['bbox'][1])[0]['text']
+        title = sorted(title_candidates, key=lambda b: b.y0)[0].text
     else:
         # Fallback: first large text on first page
-        title = text_blocks[0]['text']
+        title = text_blocks[0].text
 
     # Extract headings
     outline = []
     for b in text_blocks:
         level = None
-        if b['font_size'] == h1_size and b['is_bold']:
+        if b.size == h1_size and b.bold:
             level = 'H1'
-        elif b['font_size'] == h2_size and b['is_bold']:
+        elif b.size == h2_size and b.bold:
             level = 'H2'
-        elif b['font_size'] == h3_size and b['is_bold']:
+        elif b.size == h3_size and b.bold:
             level = 'H3'
         # Fallback: if not enough bold, use font size only
-        elif b['font_size'] == h1_size and not b['is_bold']:
+        elif b.size == h1_size and not b.bold:
             level = 'H1'
-        elif b['font_size'] == h2_size and not b['is_bold']:
+        elif b.size == h2_size and not b.bold:
             level = 'H2'
-        elif b['font_size'] == h3_size and not b['is_bold']:
+        elif b.size == h3_size and not b.bold:
             level = 'H3'
         if level:
             outline.append({
                 "level": level,
-                "text": b['text'],
-                "page": b['page']
+                "text": b.text,
+                "page": b.page
             })
 
     # Remove duplicate headings (same text, same page, same level)
@@ -0,0 +1,216 @@
+"""
+Per-stage timers, counters and peak memory, off by default.
+
+    metrics.enable()
+    with metrics.stage("parse"):
+        ...
+    metrics.count("pages")
+    metrics.write_report("metrics.json")   # or metrics.prom for Prometheus
+
+While disabled, stage() returns a shared no-op context manager and count()
+returns after one flag check, so instrumented code costs next to nothing.
+Worker processes return snapshot() to the parent, which merge()s them.
+"""
+import os
+import sys
+import json
+import time
+import resource
+from contextlib import contextmanager
+
+_enabled = False
+_timers = {}     # stage -> [seconds, calls]
+_counters = {}   # name -> total
+_peak_rss = {}   # stage -> highest process RSS seen when the stage ended, in bytes
+
+
+def _rss_bytes():
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def enable(on=True):
+    global _enabled
+    _enabled = on
+
+
+def enabled():
+    return _enabled
+
+
+def reset():
+    _timers.clear()
+    _counters.clear()
+    _peak_rss.clear()
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        timer = _timers.get(self.name)
+        if timer is None:
+            _timers[self.name] = [elapsed, 1]
+        else:
+            timer[0] += elapsed
+            timer[1] += 1
+        _peak_rss[self.name] = max(_peak_rss.get(self.name, 0), _rss_bytes())
+        return False
+
+
+def stage(name):
+    """
+    Context manager timing one pass through a stage. Nested stages are
+    timed independently, so a parent's time includes its children.
+    """
+    return _Stage(name) if _enabled else _NULL_STAGE
+
+
+def count(name, n=1):
+    if _enabled:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def snapshot():
+    """
+    Returns the current measurements as plain data that pickles cheaply.
+    """
+    return {
+        'timers': {k: list(v) for k, v in _timers.items()},
+        'counters': dict(_counters),
+        'peak_rss': dict(_peak_rss),
+    }
+
+
+def merge(snap):
+    """
+    Adds a worker's snapshot into this process's measurements. Times and
+    counts add up; peak memory keeps the per-stage maximum of any process.
+    """
+    for name, (seconds, calls) in snap['timers'].items():
+        timer = _timers.setdefault(name, [0.0, 0])
+        timer[0] += seconds
+        timer[1] += calls
+    for name, value in snap['counters'].items():
+        _counters[name] = _counters.get(name, 0) + value
+    for name, value in snap['peak_rss'].items():
+        _peak_rss[name] = max(_peak_rss.get(name, 0), value)
+
+
+def measured(func, *args):
+    """
+    Runs func(*args) in a worker process with metrics enabled and returns
+    (result, snapshot) so the parent can merge the worker's numbers.
+    """
+    enable()
+    reset()
+    result = func(*args)
+    return result, snapshot()
+
+
+def report():
+    return {
+        'stages': {
+            name: {
+                'seconds': round(seconds, 6),
+                'calls': calls,
+                'peak_rss_mb': round(_peak_rss.get(name, 0) / (1024 * 1024), 1),
+            }
+            for name, (seconds, calls) in _timers.items()
+        },
+        'counters': dict(_counters),
+        'peak_rss_mb': round(_rss_bytes() / (1024 * 1024), 1),
+    }
+
+
+def prometheus_text(prefix='pdf'):
+    lines = [
+        f'# TYPE {prefix}_stage_seconds_total counter',
+        *(f'{prefix}_stage_seconds_total{{stage="{name}"}} {seconds:.6f}'
+          for name, (seconds, _) in _timers.items()),
+        f'# TYPE {prefix}_stage_calls_total counter',
+        *(f'{prefix}_stage_calls_total{{stage="{name}"}} {calls}'
+          for name, (_, calls) in _timers.items()),
+        f'# TYPE {prefix}_stage_peak_rss_bytes gauge',
+        *(f'{prefix}_stage_peak_rss_bytes{{stage="{name}"}} {value}'
+          for name, value in _peak_rss.items()),
+    ]
+    for name, value in _counters.items():
+        lines.append(f'# TYPE {prefix}_{name}_total counter')
+        lines.append(f'{prefix}_{name}_total {value}')
+    lines.append(f'# TYPE {prefix}_peak_rss_bytes gauge')
+    lines.append(f'{prefix}_peak_rss_bytes {_rss_bytes()}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_report(path):
+    """
+    Writes the report as Prometheus text when path ends in .prom,
+    otherwise as JSON.
+    """
+    if path.endswith('.prom'):
+        text = prometheus_text()
+    else:
+        text = json.dumps(report(), indent=2)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def profiled(path):
+    """
+    Profiles the enclosed block into path when it is set: an HTML or text
+    report from pyinstrument for .html/.txt paths (if installed), a
+    cProfile dump for anything else (view with `python -m pstats`).
+    """
+    if not path:
+        yield
+        return
+    if path.endswith(('.html', '.txt')):
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("pyinstrument is not installed; writing a cProfile dump instead", file=sys.stderr)
+            path = os.path.splitext(path)[0] + '.prof'
+        else:
+            profiler = Profiler()
+            profiler.start()
+            try:
+                yield
+            finally:
+                profiler.stop()
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(profiler.output_html() if path.endswith('.html') else profiler.output_text())
+            return
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
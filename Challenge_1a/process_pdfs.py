@@ -1,182 +1,155 @@
 import os
+import sys
 import json
+import argparse
 import fitz  # PyMuPDF
 from collections import Counter
-import re
+from functools import partial
+import metrics
+from batch import run_batch, run_files, output_path_for
+from watch import Manifest, pdf_files, watch
+from result_cache import ResultCache, fingerprint
+from pdf_spans import iter_page_spans, group_lines, map_page_ranges
+from heading_rules import DASHES, WORDLIKE, TITLE_KEYWORDS, DEFAULT_LEVELS, parse_levels, \
+    block_features, heading_mask, assign_levels
 
 INPUT_DIR = '/app/input'
 OUTPUT_DIR = '/app/output'
 
-def is_heading(text, font_size, body_font_size, is_bold, font_name):
-    if len(text) < 3:
-        return False
-    if re.fullmatch(r'[-_]+', text):
-        return False
-    if font_size > body_font_size:
-        return True
-    if is_bold and font_size >= body_font_size:
-        return True
-    if text.isupper() and font_size >= body_font_size:
-        return True
-    if re.match(r'^\d+(\.\d+)*\s+.*', text):
-        return True
-    if font_name.lower().find('bold') != -1 and font_size >= body_font_size:
-        return True
-    return False
+# Bump when a change outside this file alters the extracted outlines
+EXTRACTOR_VERSION = '1'
+
+# Pages sampled for the body font size in streaming mode
+STREAM_SAMPLE_PAGES = 50
 
 def is_valid_title(text):
-    return re.search(r'[A-Za-z0-9]{3,}', text) is not None
+    return WORDLIKE.search(text) is not None
 
 def is_document_title_candidate(text):
-    keywords = [
-        'application', 'form', 'grant', 'advance', 'report', 'proposal', 'certificate',
-        'request', 'statement', 'summary', 'plan', 'notice', 'order', 'agreement'
-    ]
-    text_lower = text.lower()
-    return any(kw in text_lower for kw in keywords) and len(text) > 8
+    return len(text) > 8 and TITLE_KEYWORDS.search(text.lower()) is not None
 
-def extract_outline_from_pdf(pdf_path):
-    doc = fitz.open(pdf_path)
-    text_blocks = []
-    font_sizes = []
-    for page_num, page in enumerate(doc, 1):
-        blocks = page.get_text("dict")['blocks']
-        for block in blocks:
-            if block['type'] != 0:
-                continue
-            for line in block['lines']:
-                merged_spans = []
-                prev_span = None
-                for span in line['spans']:
-                    text = span['text'].strip()
-                    if not text:
-                        continue
-                    font_size = span['size']
-                    font_name = span['font']
-                    is_bold = 'Bold' in font_name or 'bold' in font_name
-                    bbox = span['bbox']
-                    if prev_span and abs(bbox[1] - prev_span['bbox'][1]) < 3:  # close vertically
-                        # Merge even if font/style is slightly different
-                        prev_span['text'] += ' ' + text
-                        prev_span['bbox'] = [
-                            min(prev_span['bbox'][0], bbox[0]),
-                            min(prev_span['bbox'][1], bbox[1]),
-                            max(prev_span['bbox'][2], bbox[2]),
-                            max(prev_span['bbox'][3], bbox[3])
-                        ]
-                        prev_span['font_size'] = max(prev_span['font_size'], font_size)
-                        prev_span['is_bold'] = prev_span['is_bold'] or is_bold
-                    else:
-                        if prev_span:
-                            merged_spans.append(prev_span)
-                        prev_span = {
-                            'text': text,
-                            'font_size': font_size,
-                            'is_bold': is_bold,
-                            'font_name': font_name,
-                            'page': page_num,
-                            'bbox': bbox
-                        }
-                if prev_span:
-                    merged_spans.append(prev_span)
-                for span in merged_spans:
-                    text_blocks.append(span)
-                    font_sizes.append(span['font_size'])
+def merge_line_spans(line):
+    """
+    Merges the non-empty spans of one line that sit at the same height,
+    even if their font/style differs slightly.
+    """
+    merged_spans = []
+    prev_span = None
+    for span in line:
+        text = span.text.strip()
+        if not text:
+            continue
+        if prev_span and abs(span.y0 - prev_span.y0) < 3:  # close vertically
+            prev_span.text += ' ' + text
+            prev_span.x0 = min(prev_span.x0, span.x0)
+            prev_span.y0 = min(prev_span.y0, span.y0)
+            prev_span.x1 = max(prev_span.x1, span.x1)
+            prev_span.y1 = max(prev_span.y1, span.y1)
+            prev_span.size = max(prev_span.size, span.size)
+            prev_span.bold = prev_span.bold or span.bold
+        else:
+            if prev_span:
+                merged_spans.append(prev_span)
+            prev_span = span.copy()
+            prev_span.text = text
+    if prev_span:
+        merged_spans.append(prev_span)
+    return merged_spans
 
-    if not text_blocks:
-        return {"title": "", "outline": []}
+def collect_text_blocks(doc):
+    text_blocks = []
+    for page_num, spans in iter_page_spans(doc):
+        for line in group_lines(spans):
+            text_blocks.extend(merge_line_spans(line))
+    return text_blocks
 
-    body_font_size = Counter(font_sizes).most_common(1)[0][0]
-    max_font_size = max(font_sizes)
+def is_preferred_title(text):
+    if not is_valid_title(text):
+        return False
+    if text.strip().endswith(':'):
+        return False
+    if DASHES.fullmatch(text):
+        return False
+    if any(word in text.upper() for word in ['RSVP', 'ADDRESS', 'DATE', 'TIME', 'FOR']):
+        return False
+    return True
 
+def find_title(text_blocks, max_font_size):
     #Try to find a title block with a document keyword
-    keyword_title_blocks = [b for b in text_blocks if b['page'] == 1 and is_document_title_candidate(b['text'])]
+    keyword_title_blocks = [b for b in text_blocks if b.page == 1 and is_document_title_candidate(b.text)]
     if keyword_title_blocks:
         #Sort by vertical position
-        keyword_title_blocks = sorted(keyword_title_blocks, key=lambda b: b['bbox'][1])
+        keyword_title_blocks = sorted(keyword_title_blocks, key=lambda b: b.y0)
         merged_title = ""
         last_bottom = None
         for b in keyword_title_blocks:
-            if last_bottom is None or b['bbox'][1] - last_bottom < 50:  # allow larger gap for title
-                merged_title += ("" if merged_title == "" else " ") + b['text']
-                last_bottom = b['bbox'][3]
-            else:
-                break
-        title = merged_title.strip() if merged_title else (keyword_title_blocks[0]['text'] if keyword_title_blocks else "")
-    else:
-        #Fallback to previous merged title logic
-        def is_preferred_title(text):
-            if not is_valid_title(text):
-                return False
-            if text.strip().endswith(':'):
-                return False
-            if re.fullmatch(r'[-_]+', text):
-                return False
-            if any(word in text.upper() for word in ['RSVP', 'ADDRESS', 'DATE', 'TIME', 'FOR']):
-                return False
-            return True
-
-        title_blocks = [
-            b for b in text_blocks
-            if b['page'] == 1
-            and b['font_size'] >= max_font_size - 1
-            and b['is_bold']
-            and is_preferred_title(b['text'])
-            and b['bbox'][1] < 300
-        ]
-        title_blocks = sorted(title_blocks, key=lambda b: b['bbox'][1])
-        merged_title = ""
-        last_bottom = None
-        for b in title_blocks:
-            if last_bottom is None or b['bbox'][1] - last_bottom < 30:
-                merged_title += ("" if merged_title == "" else " ") + b['text']
-                last_bottom = b['bbox'][3]
+            if last_bottom is None or b.y0 - last_bottom < 50:  # allow larger gap for title
+                merged_title += ("" if merged_title == "" else " ") + b.text
+                last_bottom = b.y1
             else:
                 break
-        title = merged_title.strip() if merged_title else (title_blocks[0]['text'] if title_blocks else "")
-        if not title:
-            valid_blocks = [b for b in text_blocks if is_preferred_title(b['text'])]
-            title = valid_blocks[0]['text'] if valid_blocks else ""
+        return merged_title.strip() if merged_title else (keyword_title_blocks[0].text if keyword_title_blocks else "")
 
-    outline = []
+    #Fallback to previous merged title logic
+    title_blocks = [
+        b for b in text_blocks
+        if b.page == 1
+        and b.size >= max_font_size - 1
+        and b.bold
+        and is_preferred_title(b.text)
+        and b.y0 < 300
+    ]
+    title_blocks = sorted(title_blocks, key=lambda b: b.y0)
+    merged_title = ""
+    last_bottom = None
+    for b in title_blocks:
+        if last_bottom is None or b.y0 - last_bottom < 30:
+            merged_title += ("" if merged_title == "" else " ") + b.text
+            last_bottom = b.y1
+        else:
+            break
+    title = merged_title.strip() if merged_title else (title_blocks[0].text if title_blocks else "")
+    if not title:
+        valid_blocks = [b for b in text_blocks if is_preferred_title(b.text)]
+        title = valid_blocks[0].text if valid_blocks else ""
+    return title
+
+def find_headings(text_blocks, body_font_size, levels=DEFAULT_LEVELS):
+    # Classify all blocks at once, then merge only the headings
+    heading_ids = heading_mask(block_features(text_blocks), body_font_size).nonzero()[0]
+    merged = []
     prev_heading = None
-    for b in text_blocks:
-        if is_heading(b['text'], b['font_size'], body_font_size, b['is_bold'], b['font_name']):
-            # Merge consecutive headings that are visually close (within 5px vertically)
-            if prev_heading and b['page'] == prev_heading['page'] and abs(b['bbox'][1] - prev_heading['bbox'][3]) < 5:
-                prev_heading['text'] += ' ' + b['text']
-                prev_heading['bbox'][2] = max(prev_heading['bbox'][2], b['bbox'][2])
-                prev_heading['bbox'][3] = max(prev_heading['bbox'][3], b['bbox'][3])
-                prev_heading['font_size'] = max(prev_heading['font_size'], b['font_size'])
-                prev_heading['is_bold'] = prev_heading['is_bold'] or b['is_bold']
-            else:
-                if prev_heading:
-                    # Assign level based on font size difference from body
-                    if prev_heading['font_size'] >= body_font_size + 3:
-                        level = 'H1'
-                    elif prev_heading['font_size'] >= body_font_size + 1:
-                        level = 'H2'
-                    else:
-                        level = 'H3'
-                    outline.append({
-                        "level": level,
-                        "text": prev_heading['text'],
-                        "page": prev_heading['page']
-                    })
-                prev_heading = b.copy()
-                prev_heading['bbox'] = list(prev_heading['bbox'])
-    if prev_heading:
-        if prev_heading['font_size'] >= body_font_size + 3:
-            level = 'H1'
-        elif prev_heading['font_size'] >= body_font_size + 1:
-            level = 'H2'
+    for i in heading_ids:
+        b = text_blocks[i]
+        # Merge consecutive headings that are visually close (within 5px vertically)
+        if prev_heading and b.page == prev_heading.page and abs(b.y0 - prev_heading.y1) < 5:
+            prev_heading.text += ' ' + b.text
+            prev_heading.x1 = max(prev_heading.x1, b.x1)
+            prev_heading.y1 = max(prev_heading.y1, b.y1)
+            prev_heading.size = max(prev_heading.size, b.size)
+            prev_heading.bold = prev_heading.bold or b.bold
         else:
-            level = 'H3'
-        outline.append({
-            "level": level,
-            "text": prev_heading['text'],
-            "page": prev_heading['page']
-        })
+            prev_heading = b.copy()
+            merged.append(prev_heading)
+    level_names = assign_levels([h.size for h in merged], body_font_size, levels)
+    return [
+        {"level": level, "text": h.text, "page": h.page}
+        for h, level in zip(merged, level_names)
+    ]
+
+def build_outline(text_blocks, levels=DEFAULT_LEVELS):
+    if not text_blocks:
+        return {"title": "", "outline": []}
+
+    with metrics.stage('font_stats'):
+        font_sizes = [b.size for b in text_blocks]
+        body_font_size = Counter(font_sizes).most_common(1)[0][0]
+        max_font_size = max(font_sizes)
+
+    with metrics.stage('title'):
+        title = find_title(text_blocks, max_font_size)
+    with metrics.stage('headings'):
+        outline = find_headings(text_blocks, body_font_size, levels)
 
     #Remove duplicates
     seen = set()
@@ -187,21 +160,208 @@ def extract_outline_from_pdf(pdf_path):
             unique_outline.append(item)
             seen.add(key)
 
+    metrics.count('text_blocks', len(text_blocks))
+    metrics.count('headings', len(unique_outline))
     return {
         "title": title,
         "outline": unique_outline
     }
 
-def main():
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-    for filename in os.listdir(INPUT_DIR):
-        if filename.lower().endswith('.pdf'):
-            pdf_path = os.path.join(INPUT_DIR, filename)
-            outline = extract_outline_from_pdf(pdf_path)
-            output_filename = os.path.splitext(filename)[0] + '.json'
-            output_path = os.path.join(OUTPUT_DIR, output_filename)
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(outline, f, ensure_ascii=False, indent=2)
+def extract_outline_from_pdf(pdf_path, page_workers=1, levels=DEFAULT_LEVELS):
+    """
+    With page_workers > 1, large documents are parsed in that many page
+    ranges in parallel; the merged blocks give the same outline as a
+    sequential pass.
+    """
+    if page_workers > 1:
+        text_blocks = [b for part in map_page_ranges(pdf_path, collect_page_range, page_workers) for b in part]
+    else:
+        with fitz.open(pdf_path) as doc:
+            text_blocks = collect_text_blocks(doc)
+    return build_outline(text_blocks, levels)
+
+def iter_page_blocks(doc, page_numbers=None):
+    """
+    Yields (page number, merged text blocks) one page at a time.
+    """
+    for page_num, spans in iter_page_spans(doc, page_numbers):
+        yield page_num, [b for line in group_lines(spans) for b in merge_line_spans(line)]
+
+def collect_page_range(pdf_path, page_numbers):
+    # Worker side of extract_outline_from_pdf: the body font size and
+    # heading merges need every page, so they are computed after merging
+    with fitz.open(pdf_path) as doc:
+        return [b for _, blocks in iter_page_blocks(doc, page_numbers) for b in blocks]
+
+def sample_page_numbers(page_count, sample_pages):
+    if page_count <= sample_pages:
+        return list(range(1, page_count + 1))
+    # Evenly spaced, always including the first page
+    step = (page_count - 1) / (sample_pages - 1)
+    return sorted({1 + round(i * step) for i in range(sample_pages)})
+
+def stream_outline_from_pdf(pdf_path, sample_pages=STREAM_SAMPLE_PAGES, levels=DEFAULT_LEVELS):
+    """
+    Generator form of extract_outline_from_pdf for very large documents:
+    yields {"title": ...} first and then one outline entry at a time, so
+    only one page of spans is held in memory.
+
+    The body font size is the most common size over up to `sample_pages`
+    evenly spaced pages. When the sample covers the whole document the
+    output matches extract_outline_from_pdf exactly; otherwise the font
+    sizes and title fallbacks are estimated from the sample.
+    """
+    with fitz.open(pdf_path) as doc:
+        sampled = sample_page_numbers(len(doc), sample_pages)
+        full_sample = len(sampled) == len(doc)
+        font_sizes = Counter()
+        kept_blocks = []
+        first_page_blocks = []
+        for page_num, blocks in iter_page_blocks(doc, sampled):
+            font_sizes.update(b.size for b in blocks)
+            if full_sample:
+                kept_blocks.extend(blocks)
+            elif page_num == 1:
+                first_page_blocks = blocks
+
+        if not font_sizes:
+            yield {"title": ""}
+            return
+
+        body_font_size = font_sizes.most_common(1)[0][0]
+        max_font_size = max(font_sizes)
+        yield {"title": find_title(kept_blocks if full_sample else first_page_blocks, max_font_size)}
+
+        if full_sample:
+            pages = [(page_num, [b for b in kept_blocks if b.page == page_num]) for page_num in sampled]
+        else:
+            pages = iter_page_blocks(doc)
+        # Headings only merge within a page, so per-page detection and
+        # de-duplication give the same result as a whole-document pass
+        for page_num, blocks in pages:
+            seen = set()
+            for item in find_headings(blocks, body_font_size, levels):
+                key = (item['level'], item['text'])
+                if key not in seen:
+                    seen.add(key)
+                    yield item
+
+def extract_outline_streaming(pdf_path, levels=DEFAULT_LEVELS):
+    records = stream_outline_from_pdf(pdf_path, levels=levels)
+    title = next(records)["title"]
+    return {"title": title, "outline": list(records)}
+
+def write_outline_jsonl(pdf_path, output_dir, levels=DEFAULT_LEVELS):
+    """
+    Streams the outline of pdf_path to <name>.jsonl in output_dir: the
+    title record first, then one line per heading.
+    """
+    output_path = os.path.join(output_dir, os.path.splitext(os.path.basename(pdf_path))[0] + '.jsonl')
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for record in stream_outline_from_pdf(pdf_path, levels=levels):
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    os.replace(tmp_path, output_path)
+
+def extractor_fingerprint(levels=DEFAULT_LEVELS, stream=False):
+    # Streamed outlines of long PDFs are estimated from sampled pages, so
+    # the two modes must not share cached results
+    here = os.path.dirname(os.path.abspath(__file__))
+    mode = 'stream' if stream else 'full'
+    return fingerprint(f'{EXTRACTOR_VERSION}:{mode}:{levels}', os.path.abspath(__file__),
+                       os.path.join(here, 'pdf_spans.py'), os.path.join(here, 'heading_rules.py'))
+
+def extract_outline_cached(pdf_path, cache_dir, cache_fingerprint, extract=extract_outline_from_pdf):
+    cache = ResultCache(cache_dir, cache_fingerprint)
+    return cache.get_or_compute(pdf_path, extract)
+
+def watch_input(extract, args, workers):
+    """
+    Watch mode: re-extracts only PDFs that are new or whose contents
+    changed, rewriting their outputs atomically, and removes the outputs
+    of deleted PDFs.
+    """
+    suffix = '.jsonl' if args.stream and args.jsonl else '.json'
+    manifest = Manifest(args.manifest or os.path.join(args.output, '.manifest.json'))
+
+    def on_change(changed, removed):
+        failures = run_files(extract, changed, args.output, workers=workers, timeout=args.timeout)
+        for pdf_path, _ in failures:
+            print(f"Will retry {os.path.basename(pdf_path)} when it changes", file=sys.stderr)
+        for pdf_path in removed:
+            output_path = os.path.splitext(output_path_for(pdf_path, args.output))[0] + suffix
+            if os.path.exists(output_path):
+                os.remove(output_path)
+
+    watch(lambda: pdf_files(args.input), manifest, on_change, interval=args.interval)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract title and H1-H3 outline from PDFs.")
+    parser.add_argument('--input', default=INPUT_DIR, help="directory containing PDFs")
+    parser.add_argument('--output', default=OUTPUT_DIR, help="directory for JSON outputs")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="number of worker processes (0 = one per CPU)")
+    parser.add_argument('--timeout', type=int, default=None,
+                        help="per-file time limit in seconds")
+    parser.add_argument('--cache-dir', default=None,
+                        help="reuse outlines of unchanged PDFs from this directory")
+    parser.add_argument('--cache-max-mb', type=int, default=512)
+    parser.add_argument('--stream', action='store_true',
+                        help="process pages one at a time with bounded memory (for very large PDFs)")
+    parser.add_argument('--jsonl', action='store_true',
+                        help="with --stream, write <name>.jsonl incrementally instead of <name>.json")
+    parser.add_argument('--page-workers', type=int, default=1,
+                        help="split each large PDF into page ranges parsed by this many processes "
+                             "(0 = one per CPU; with --workers, at most CPUs / workers)")
+    parser.add_argument('--levels', type=parse_levels, default=DEFAULT_LEVELS,
+                        help="heading level thresholds in points above body text (default: H1=3,H2=1)")
+    parser.add_argument('--watch', action='store_true',
+                        help="keep running and process PDFs as they are added or modified")
+    parser.add_argument('--interval', type=float, default=2.0,
+                        help="with --watch, seconds between scans of the input directory")
+    parser.add_argument('--manifest', default=None,
+                        help="with --watch, processed-file manifest (default: <output>/.manifest.json)")
+    parser.add_argument('--metrics', default=None,
+                        help="write per-stage timings, counters and peak memory here (.json, or .prom for Prometheus)")
+    parser.add_argument('--profile', default=None,
+                        help="profile the run into this file (.prof for cProfile, .html/.txt for pyinstrument)")
+    args = parser.parse_args(argv)
+    if args.metrics:
+        metrics.enable()
+
+    workers = args.workers or os.cpu_count() or 1
+    page_workers = args.page_workers or os.cpu_count() or 1
+    if workers > 1 and page_workers > 1:
+        # File and page workers share one CPU budget rather than nesting
+        # workers x page_workers processes
+        budget = max(1, (os.cpu_count() or 1) // workers)
+        if page_workers > budget:
+            print(f"Using {budget} page worker(s) per file with {workers} file workers", file=sys.stderr)
+            page_workers = budget
+    if args.stream:
+        extract = partial(extract_outline_streaming, levels=args.levels)
+    else:
+        extract = partial(extract_outline_from_pdf, page_workers=page_workers, levels=args.levels)
+    cache = None
+    if args.stream and args.jsonl:
+        extract = partial(write_outline_jsonl, output_dir=args.output, levels=args.levels)
+    elif args.cache_dir:
+        cache = ResultCache(args.cache_dir, extractor_fingerprint(args.levels, args.stream),
+                            max_bytes=args.cache_max_mb * 1024 * 1024)
+        extract = partial(extract_outline_cached, extract=extract, cache_dir=args.cache_dir,
+                          cache_fingerprint=cache.fingerprint)
+    if args.watch:
+        watch_input(extract, args, workers)
+        return
+    with metrics.profiled(args.profile):
+        failures = run_batch(extract, args.input, args.output,
+                             workers=workers, timeout=args.timeout)
+    if cache is not None:
+        cache.evict()
+    if args.metrics:
+        metrics.write_report(args.metrics)
+    if failures:
+        print(f"{len(failures)} file(s) failed", file=sys.stderr)
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,104 @@
+import os
+import sys
+import json
+import time
+from result_cache import file_digest
+
+
+class Manifest:
+    """
+    Processed input files with their size, mtime and content hash, kept as
+    one JSON file. A file counts as changed when its contents differ from
+    the recorded hash; the hash is only recomputed when size or mtime
+    moved, so polling an unchanged directory costs one stat per file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.files = {}
+        self._pending = {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self.files = json.load(f)
+        except (FileNotFoundError, ValueError):
+            pass
+
+    def changes(self, paths):
+        """
+        Returns (changed, removed): paths that are new or whose contents
+        changed, and recorded paths no longer present. Call commit() once
+        they have been handled.
+        """
+        changed = []
+        self._pending = {}
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entry = self.files.get(path)
+            if entry and entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns:
+                continue
+            digest = file_digest(path)
+            self._pending[path] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha256': digest}
+            if not entry or entry['sha256'] != digest:
+                changed.append(path)
+        present = set(paths)
+        removed = [path for path in self.files if path not in present]
+        return changed, removed
+
+    def commit(self, removed=(), failed=()):
+        """
+        Records the last changes() as handled, except `failed` paths, which
+        are reported again by the next call.
+        """
+        failed = set(failed)
+        self.files.update((path, entry) for path, entry in self._pending.items() if path not in failed)
+        for path in removed:
+            if path not in failed:
+                self.files.pop(path, None)
+        self._pending = {}
+        self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.files, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def pdf_files(directory):
+    return sorted(
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if name.lower().endswith('.pdf')
+    )
+
+
+def watch(list_files, manifest, on_change, interval=2.0, once=False):
+    """
+    Polls list_files() every `interval` seconds and calls
+    on_change(changed, removed) whenever files were added, modified or
+    deleted since they were last handled. on_change may return the paths
+    it failed to handle; they are retried on the next poll. With
+    once=True, handles the current changes and returns. Stops on Ctrl-C.
+    """
+    try:
+        while True:
+            changed, removed = manifest.changes(list_files())
+            failed = []
+            if changed or removed:
+                start = time.perf_counter()
+                failed = on_change(changed, removed) or []
+                print(f"Updated {len(changed)} changed and {len(removed)} removed file(s) "
+                      f"in {time.perf_counter() - start:.2f}s" + (f", {len(failed)} failed" if failed else ""),
+                      file=sys.stderr)
+            if changed or removed or manifest._pending:
+                # Also records files that were only touched, so they are not rehashed
+                manifest.commit(removed, failed)
+            if once:
+                return
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
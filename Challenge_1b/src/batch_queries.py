@@ -0,0 +1,168 @@
+"""
+Answers many persona/job queries over a shared set of PDFs in one run.
+
+Documents named by any query are extracted and embedded once, all queries
+are embedded in a single call, and every query-section similarity comes
+from one matrix product. Each query is then re-ranked and analysed as in
+main.py, and writes the same output JSON main.py would.
+
+    python batch_queries.py PDF_FOLDER OUTPUT_DIR input1.json [input2.json ...]
+
+An input file is either a normal challenge input or {"requests": [...]}
+holding several of them; a request may name its output file with "output".
+"""
+import os
+import json
+import argparse
+from collections import Counter
+from extract_sections import extract_all_sections, open_cache
+from inference_backend import add_backend_args, configure_backend, model_key
+from embedder import embed_queries, embed_sections, MODEL_NAME
+from embedding_store import EmbeddingStore, embed_sections_incremental
+from vector_index import normalize_rows
+from ranker import rank_sections, CrossScoreCache
+from main import parse_weights, rerank_options, timed, refine_and_format
+
+
+def output_name(input_path, position=None, request=None):
+    if request is not None and request.get("output"):
+        return request["output"]
+    stem = os.path.splitext(os.path.basename(input_path))[0]
+    if position is not None:
+        stem = f"{stem}_request_{position + 1}"
+    if "input" in stem:
+        return stem.replace("input", "output") + ".json"
+    return stem + "_output.json"
+
+
+def load_requests(input_paths):
+    """
+    Returns [(output_name, input_data), ...] for all input files. When
+    inputs with the same file name (from different directories) would
+    share an output name, the input's position on the command line is
+    appended; explicit "output" names that clash are an error.
+    """
+    entries = []
+    for index, path in enumerate(input_paths):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if "requests" in data:
+            for position, request in enumerate(data["requests"]):
+                entries.append((output_name(path, position, request), request, index, bool(request.get("output"))))
+        else:
+            entries.append((output_name(path), data, index, False))
+
+    counts = Counter(name for name, _, _, _ in entries)
+    requests = []
+    for name, data, index, explicit in entries:
+        if counts[name] > 1 and not explicit:
+            stem, ext = os.path.splitext(name)
+            name = f"{stem}_{index + 1}{ext}"
+        requests.append((name, data))
+    clashes = sorted(name for name, count in Counter(name for name, _ in requests).items() if count > 1)
+    if clashes:
+        raise ValueError(f"several requests would write {', '.join(clashes)}")
+    return requests
+
+
+def document_rows(sections):
+    """
+    Maps each document to the indices of its sections, in extraction order.
+    """
+    rows = {}
+    for i, sec in enumerate(sections):
+        rows.setdefault(sec["document"], []).append(i)
+    return rows
+
+
+def run_queries(requests, pdf_folder, cache=None, store=None, timings=None, weights=None,
+                rerank=None, cross_cache=None):
+    """
+    Runs every input JSON in `requests` against pdf_folder and returns their
+    output JSONs in the same order.
+    """
+    if timings is None:
+        timings = {}
+
+    filenames_per_query = [[doc["filename"] for doc in data["documents"]] for data in requests]
+    all_filenames = list(dict.fromkeys(name for names in filenames_per_query for name in names))
+
+    with timed(timings, "extract"):
+        sections = extract_all_sections(pdf_folder, all_filenames, cache=cache)
+
+    with timed(timings, "embed"):
+        pairs = [(data["persona"]["role"], data["job_to_be_done"]["task"]) for data in requests]
+        query_vecs = embed_queries(pairs)
+        if store is not None:
+            section_vecs = embed_sections_incremental(store, pdf_folder, sections, embed_sections)
+        else:
+            section_vecs = embed_sections([sec["full_text"] for sec in sections])
+
+    with timed(timings, "rank"):
+        # One (queries x sections) product instead of one scan per query
+        similarities = normalize_rows(query_vecs) @ normalize_rows(section_vecs).T
+        rows = document_rows(sections)
+
+    outputs = []
+    for q, (data, filenames) in enumerate(zip(requests, filenames_per_query)):
+        persona_text, job_text = pairs[q]
+        with timed(timings, "rank"):
+            ids = [i for name in dict.fromkeys(filenames) for i in rows.get(name, [])]
+            query_sections = [sections[i] for i in ids]
+            query_section_vecs = section_vecs[ids]
+            initial_top = rank_sections(query_sections, query_section_vecs, query_vecs[q], top_k=10,
+                                        weights=weights, similarities=similarities[q, ids])
+        outputs.append(refine_and_format(query_sections, query_section_vecs, initial_top, query_vecs[q],
+                                         persona_text, job_text, filenames, timings,
+                                         rerank=rerank, cross_cache=cross_cache))
+    return outputs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rank PDF sections for many queries over one PDF folder.")
+    parser.add_argument("pdf_folder")
+    parser.add_argument("output_dir")
+    parser.add_argument("input_json", nargs="+")
+    parser.add_argument("--cache-dir", default=os.environ.get("SECTION_CACHE_DIR"),
+                        help="reuse extracted sections of unchanged PDFs from this directory")
+    parser.add_argument("--embedding-store", default=os.environ.get("EMBEDDING_STORE_DIR"),
+                        help="persist section embeddings here and only embed new or changed PDFs")
+    parser.add_argument("--weights", type=parse_weights, default=None,
+                        help="hybrid score weights, e.g. similarity=0.7,length=0.2,position=0.1")
+    parser.add_argument("--rerank-depth", type=int, default=None)
+    parser.add_argument("--rerank-cutoff", type=float, default=None)
+    parser.add_argument("--rerank-margin", type=float, default=None)
+    parser.add_argument("--rerank-window", type=int, default=None)
+    parser.add_argument("--cross-cache", default=os.environ.get("CROSS_SCORE_CACHE"),
+                        help="JSON file caching cross-encoder scores across runs")
+    add_backend_args(parser)
+    args = parser.parse_args(argv)
+    configure_backend(args)
+
+    try:
+        requests = load_requests(args.input_json)
+    except ValueError as e:
+        parser.error(str(e))
+    cache = open_cache(args.cache_dir)
+    store = EmbeddingStore(args.embedding_store, model_key(MODEL_NAME)) if args.embedding_store else None
+    cross_cache = CrossScoreCache(args.cross_cache) if args.cross_cache else None
+    timings = {}
+    outputs = run_queries([data for _, data in requests], args.pdf_folder, cache=cache, store=store,
+                          timings=timings, weights=args.weights, rerank=rerank_options(args),
+                          cross_cache=cross_cache)
+    if cross_cache is not None:
+        cross_cache.save()
+    if cache is not None:
+        cache.evict()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    for (name, _), output in zip(requests, outputs):
+        path = os.path.join(args.output_dir, name)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(output, f, indent=2)
+        print(f"Output saved to {path}")
+    print(", ".join(f"{stage}={seconds:.2f}s" for stage, seconds in timings.items()))
+
+
+if __name__ == "__main__":
+    main()
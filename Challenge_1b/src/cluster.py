@@ -0,0 +1,144 @@
+"""
+Multi-node section extraction over a shared filesystem.
+
+The coordinator enqueues one job per document of the input JSON into a
+SQLite work queue, workers on any machine that sees the same paths claim
+and extract them, and the merge step writes the same JSON as
+`main.py --extract-only` (optionally also a section corpus for --corpus):
+
+    python cluster.py init   --db /shared/queue.sqlite --input in.json --pdf-folder PDFs --output sections.json --shards 4
+    python cluster.py worker --db /shared/queue.sqlite [--shard N]
+    python cluster.py status --db /shared/queue.sqlite
+    python cluster.py merge  --db /shared/queue.sqlite [--corpus DIR]
+
+Each worker writes its document's sections to <output>.parts/<position>.json.
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+from functools import partial
+import work_queue
+
+
+def parts_dir(output_json):
+    return output_json + ".parts"
+
+
+def init(db_path, input_json, pdf_folder, output_json, shards=1):
+    """
+    Enqueues the input's documents in input order, spread over `shards`.
+    Re-running it only adds documents that are not queued yet. Paths are
+    stored absolute so workers started elsewhere resolve them the same way.
+    """
+    with open(input_json, encoding="utf-8") as f:
+        filenames = [doc["filename"] for doc in json.load(f)["documents"]]
+    pdf_folder = os.path.abspath(pdf_folder)
+    output_json = os.path.abspath(output_json)
+    jobs = [
+        (f"{position}:{name}",
+         {"position": position, "filename": name, "pdf_folder": pdf_folder, "output": output_json})
+        for position, name in enumerate(filenames)
+    ]
+    queue = work_queue.JobQueue(db_path)
+    queue.add(jobs, shards)
+    queue.close()
+    print(f"Queued {len(jobs)} document(s) in {shards} shard(s)", file=sys.stderr)
+
+
+def handle_job(cache_dir, page_workers, payload):
+    from extract_sections import extract_all_sections, open_cache
+
+    sections = extract_all_sections(payload["pdf_folder"], [payload["filename"]], cache=open_cache(cache_dir),
+                                    page_workers=page_workers)
+    directory = parts_dir(payload["output"])
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{payload['position']}.json")
+    tmp_path = path + f".{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(sections, f)
+    os.replace(tmp_path, path)
+
+
+def merge(db_path, corpus_dir=None):
+    """
+    Concatenates the documents' sections in input order and writes them
+    like main.py --extract-only. Returns the (key, error) pairs of jobs
+    that did not finish; nothing is written unless every job is done.
+    """
+    from main import write_json_atomic
+
+    queue = work_queue.JobQueue(db_path)
+    try:
+        if queue.unfinished():
+            raise RuntimeError(f"{queue.unfinished()} job(s) are still pending or running")
+        jobs = queue.jobs()
+    finally:
+        queue.close()
+    incomplete = [(key, error or "lease expired") for key, _, state, error in jobs if state != "done"]
+    if incomplete or not jobs:
+        return incomplete
+
+    payloads = [payload for _, payload, _, _ in jobs]
+    if not os.path.isdir(parts_dir(payloads[0]["output"])):
+        raise RuntimeError(f"no staged sections in {parts_dir(payloads[0]['output'])} (already merged?)")
+    sections = []
+    for payload in payloads:
+        with open(os.path.join(parts_dir(payload["output"]), f"{payload['position']}.json"), encoding="utf-8") as f:
+            sections.extend(json.load(f))
+    filenames = [payload["filename"] for payload in payloads]
+    output_json = payloads[0]["output"]
+    write_json_atomic({"metadata": {"input_documents": filenames}, "sections": sections}, output_json)
+    if corpus_dir:
+        from section_corpus import SectionCorpus, pdf_sources
+        SectionCorpus.from_sections(sections, pdf_sources(payloads[0]["pdf_folder"], filenames)).save(corpus_dir)
+    shutil.rmtree(parts_dir(output_json), ignore_errors=True)
+    return incomplete
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract sections with workers sharing a job queue.")
+    parser.add_argument("command", choices=["init", "worker", "status", "merge"])
+    parser.add_argument("--db", required=True, help="queue database on the shared filesystem")
+    parser.add_argument("--input", help="with init, the challenge input JSON")
+    parser.add_argument("--pdf-folder", help="with init, directory containing the input's PDFs")
+    parser.add_argument("--output", help="with init, where merge writes the sections JSON")
+    parser.add_argument("--shards", type=int, default=1, help="with init, number of shards")
+    parser.add_argument("--shard", type=int, default=None, help="with worker, only take jobs from this shard")
+    parser.add_argument("--lease", type=float, default=work_queue.DEFAULT_LEASE,
+                        help="with worker, seconds a job stays claimed without a heartbeat")
+    parser.add_argument("--cache-dir", default=os.environ.get("SECTION_CACHE_DIR"),
+                        help="with worker, reuse extracted sections of unchanged PDFs from this directory")
+    parser.add_argument("--page-workers", type=int, default=1,
+                        help="with worker, extract each large PDF in page ranges across this many processes")
+    parser.add_argument("--corpus", default=None, help="with merge, also save the sections as a corpus here")
+    args = parser.parse_args(argv)
+
+    if args.command == "init":
+        if not (args.input and args.pdf_folder and args.output):
+            parser.error("init needs --input, --pdf-folder and --output")
+        init(args.db, args.input, args.pdf_folder, args.output, args.shards)
+    elif args.command == "worker":
+        page_workers = args.page_workers or os.cpu_count() or 1
+        done = work_queue.run_worker(args.db, partial(handle_job, args.cache_dir, page_workers),
+                                     lease=args.lease, shard=args.shard)
+        print(f"Worker {work_queue.default_owner()} finished {done} job(s)", file=sys.stderr)
+    elif args.command == "status":
+        queue = work_queue.JobQueue(args.db)
+        work_queue.print_status(queue)
+        queue.close()
+    else:
+        try:
+            incomplete = merge(args.db, args.corpus)
+        except RuntimeError as e:
+            sys.exit(f"Not merged: {e}")
+        for key, error in incomplete:
+            print(f"Failed: {key} -> {error}", file=sys.stderr)
+        if incomplete:
+            print(f"{len(incomplete)} document(s) failed", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
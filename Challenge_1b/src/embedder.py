@@ -1,20 +1,63 @@
-from sentence_transformers import SentenceTransformer
 import numpy as np
+import metrics
+from inference_backend import load_bi_encoder
 
-# Load the model once
-model = SentenceTransformer("multi-qa-mpnet-base-dot-v1")
+MODEL_NAME = "multi-qa-mpnet-base-dot-v1"
+
+_model = None
+
+def get_model():
+    """
+    Loads the model on first use (with the configured inference backend)
+    and keeps it for later calls.
+    """
+    global _model
+    if _model is None:
+        with metrics.stage("model_load"):
+            _model = load_bi_encoder(MODEL_NAME)
+    return _model
+
+def count_encoded(model, texts):
+    """
+    Adds texts and tokens about to be encoded to the metrics counters.
+    Tokenizing again costs time, so this only runs when metrics are on.
+    """
+    if not metrics.enabled():
+        return
+    metrics.count("texts_encoded", len(texts))
+    tokenizer = getattr(model, "tokenizer", None)
+    if tokenizer is None:
+        metrics.count("tokens_encoded", sum(len(t.split()) for t in texts))
+    else:
+        metrics.count("tokens_encoded", sum(len(ids) for ids in tokenizer(list(texts), truncation=True)["input_ids"]))
+
+def encode(texts):
+    model = get_model()
+    count_encoded(model, texts)
+    with metrics.stage("encode"):
+        return model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+
+def query_text(persona, job):
+    return f"Persona: {persona.strip()}. Job: {job.strip()}"
 
 def embed_query(persona, job):
     """
     Combines persona and job-to-be-done into a single sentence
     and returns the embedding.
     """
-    combined = f"Persona: {persona.strip()}. Job: {job.strip()}"
-    embedding = model.encode([combined], convert_to_numpy=True, normalize_embeddings=True)
+    combined = query_text(persona, job)
+    embedding = encode([combined])
     return embedding[0]
 
+def embed_queries(persona_job_pairs):
+    """
+    Embeds many (persona, job) pairs in one call.
+    """
+    combined = [query_text(persona, job) for persona, job in persona_job_pairs]
+    return encode(combined)
+
 def embed_sections(section_texts):
     """
     Takes a list of full_text strings and returns list of embeddings.
     """
-    return model.encode(section_texts, convert_to_numpy=True, normalize_embeddings=True)
+    return encode(section_texts)
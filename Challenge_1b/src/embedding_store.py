@@ -0,0 +1,251 @@
+import os
+import re
+import json
+import hashlib
+import argparse
+from contextlib import contextmanager
+import numpy as np
+from result_cache import file_digest
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are not serialized
+    fcntl = None
+
+META_FILE = "meta.json"
+VECTORS_FILE = "vectors.f32"
+LOCK_FILE = ".lock"
+
+# Compact once more than this fraction of the stored rows is unused
+COMPACT_STALE_FRACTION = 0.5
+
+
+def texts_digest(texts):
+    h = hashlib.sha256()
+    for text in texts:
+        h.update(text.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class EmbeddingStore:
+    """
+    Persistent section embeddings for one model.
+
+    Vectors live in a flat float32 file that is memory-mapped as a
+    (rows, dim) matrix; meta.json maps each document's content hash to the
+    contiguous block of rows holding its sections, in section order, so a
+    section is addressed by (document hash, section offset, model name).
+    New documents are appended; a document whose PDF or extracted text
+    changed simply gets a new block, which replaces the entry previously
+    stored for the same PDF path, and compact() drops the stale rows
+    (automatically once they make up more than COMPACT_STALE_FRACTION of
+    the file). Writers take an exclusive lock and re-read meta.json first,
+    so several processes can share a store.
+    """
+
+    def __init__(self, store_dir, model_name):
+        slug = re.sub(r"[^A-Za-z0-9._-]+", "_", model_name)
+        self.path = os.path.join(store_dir, slug)
+        self.model_name = model_name
+        os.makedirs(self.path, exist_ok=True)
+        self._load_meta()
+
+    def _load_meta(self):
+        self.meta = {"model": self.model_name, "dim": None, "rows": 0, "documents": {}}
+        meta_path = os.path.join(self.path, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                self.meta = json.load(f)
+        self._matrix = None
+
+    @contextmanager
+    def _locked(self):
+        """
+        Serializes writers across processes; picks up what other writers
+        stored in the meantime.
+        """
+        with open(os.path.join(self.path, LOCK_FILE), "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self._load_meta()
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def matrix(self):
+        """
+        Read-only memory map over all stored vectors.
+        """
+        if self._matrix is None:
+            rows, dim = self.meta["rows"], self.meta["dim"]
+            if not rows:
+                return np.zeros((0, dim or 0), dtype=np.float32)
+            self._matrix = np.memmap(os.path.join(self.path, VECTORS_FILE),
+                                     dtype=np.float32, mode="r", shape=(rows, dim))
+        return self._matrix
+
+    def lookup(self, doc_hash, digest):
+        """
+        Returns the rows stored for a document, or None if it is missing or
+        was embedded from different section texts.
+        """
+        entry = self.meta["documents"].get(doc_hash)
+        if entry is None or entry["texts"] != digest:
+            return None
+        return self.matrix()[entry["start"]:entry["start"] + entry["count"]]
+
+    def append(self, doc_hash, digest, vectors, source=None):
+        """
+        Stores a document's rows. `source`, the PDF's absolute path, lets a
+        changed PDF supersede the entry of its previous contents.
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self._locked():
+            if self.meta["dim"] is None:
+                self.meta["dim"] = int(vectors.shape[1])
+            start = self.meta["rows"]
+            vectors_path = os.path.join(self.path, VECTORS_FILE)
+            # Write at the recorded end rather than EOF so bytes left behind by
+            # an interrupted append are overwritten instead of misaligning rows
+            with open(vectors_path, "r+b" if os.path.exists(vectors_path) else "wb") as f:
+                f.seek(start * self.meta["dim"] * 4)
+                f.write(vectors.tobytes())
+                f.truncate()
+            self.meta["rows"] = start + len(vectors)
+            documents = self.meta["documents"]
+            if source is not None:
+                for old_hash in [h for h, entry in documents.items() if entry.get("source") == source]:
+                    del documents[old_hash]
+            documents[doc_hash] = {"start": start, "count": len(vectors), "texts": digest, "source": source}
+            self._matrix = None
+            self._save_meta()
+        self.compact_if_stale()
+
+    def _save_meta(self):
+        meta_path = os.path.join(self.path, META_FILE)
+        tmp_path = meta_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_path, meta_path)
+
+    def stale_rows(self, keep_hashes=None):
+        """
+        Rows compact(keep_hashes) would drop.
+        """
+        documents = self.meta["documents"]
+        keep = documents if keep_hashes is None else set(keep_hashes)
+        return self.meta["rows"] - sum(entry["count"] for doc_hash, entry in documents.items() if doc_hash in keep)
+
+    def compact_if_stale(self, keep_hashes=None, threshold=COMPACT_STALE_FRACTION):
+        """
+        Compacts when more than `threshold` of the rows would be dropped.
+        Returns whether it did.
+        """
+        if self.stale_rows(keep_hashes) <= threshold * self.meta["rows"]:
+            return False
+        self.compact(keep_hashes)
+        return True
+
+    def compact(self, keep_hashes=None):
+        """
+        Rewrites the vector file without stale rows, keeping only the given
+        documents (default: every document still referenced).
+        """
+        with self._locked():
+            keep = None if keep_hashes is None else set(keep_hashes)
+            old = self.matrix()
+            blocks, documents, start = [], {}, 0
+            for doc_hash, entry in self.meta["documents"].items():
+                if keep is not None and doc_hash not in keep:
+                    continue
+                blocks.append(np.array(old[entry["start"]:entry["start"] + entry["count"]]))
+                documents[doc_hash] = dict(entry, start=start)
+                start += entry["count"]
+            self._matrix = None
+            del old
+            data = np.concatenate(blocks) if blocks else np.zeros((0, self.meta["dim"] or 0), np.float32)
+            # A new file: processes that mapped the old one keep reading it
+            vectors_path = os.path.join(self.path, VECTORS_FILE)
+            data.astype(np.float32).tofile(vectors_path + ".tmp")
+            os.replace(vectors_path + ".tmp", vectors_path)
+            self.meta["rows"] = start
+            self.meta["documents"] = documents
+            self._save_meta()
+
+
+def embed_sections_incremental(store, pdf_folder, sections, embed_fn):
+    """
+    Returns embeddings for `sections` (as produced by extract_all_sections),
+    calling embed_fn only for documents the store has not seen with the
+    same contents. Rows are in the same order as `sections`.
+    """
+    groups = []
+    for i, sec in enumerate(sections):
+        if groups and groups[-1][0] == sec["document"]:
+            groups[-1][1].append(i)
+        else:
+            groups.append((sec["document"], [i]))
+
+    vectors = [None] * len(groups)
+    missing = []
+    for g, (document, indices) in enumerate(groups):
+        texts = [sections[i]["full_text"] for i in indices]
+        path = os.path.abspath(os.path.join(pdf_folder, document))
+        doc_hash = file_digest(path)
+        digest = texts_digest(texts)
+        stored = store.lookup(doc_hash, digest)
+        if stored is None:
+            missing.append((g, doc_hash, digest, texts, path))
+        else:
+            vectors[g] = np.asarray(stored)
+
+    # One encode call for everything new keeps batches full
+    if missing:
+        new_vectors = embed_fn([t for _, _, _, texts, _ in missing for t in texts])
+        offset = 0
+        for g, doc_hash, digest, texts, path in missing:
+            block = new_vectors[offset:offset + len(texts)]
+            offset += len(texts)
+            store.append(doc_hash, digest, block, source=path)
+            vectors[g] = np.asarray(block, dtype=np.float32)
+
+    if not vectors:
+        return np.zeros((0, store.meta["dim"] or 0), dtype=np.float32)
+    return np.concatenate(vectors)
+
+
+def pdf_hashes(pdf_folders):
+    return [
+        file_digest(os.path.join(folder, name))
+        for folder in pdf_folders for name in sorted(os.listdir(folder))
+        if name.lower().endswith(".pdf")
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or compact an embedding store.")
+    parser.add_argument("store_dir")
+    parser.add_argument("--model", default="multi-qa-mpnet-base-dot-v1",
+                        help="model key, with the backend suffix for non-torch backends (e.g. NAME.onnx-int8)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="print document, row and stale row counts")
+    comp = sub.add_parser("compact", help="drop unused rows")
+    comp.add_argument("--pdfs", nargs="+", metavar="PDF_FOLDER",
+                      help="also drop documents that are not among the PDFs in these folders")
+    args = parser.parse_args(argv)
+
+    store = EmbeddingStore(args.store_dir, args.model)
+    if args.command == "compact":
+        before = store.meta["rows"]
+        store.compact(pdf_hashes(args.pdfs) if args.pdfs else None)
+        print(f"Removed {before - store.meta['rows']} rows")
+    else:
+        print(f"{len(store.meta['documents'])} documents, {store.meta['rows']} rows, "
+              f"{store.stale_rows()} stale")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,12 @@
 import fitz  # PyMuPDF
 import os
+from result_cache import ResultCache, fingerprint, DEFAULT_MAX_BYTES
+from functools import partial
+import metrics
+from pdf_spans import iter_page_spans, group_blocks, map_page_ranges
+
+# Bump when a change outside this file alters the extracted sections
+EXTRACTOR_VERSION = '1'
 
 def is_valid_title(title):
     title = title.strip()
@@ -9,51 +16,82 @@ def is_valid_title(title):
         return False
     return True
 
-def extract_sections_from_pdf(pdf_path):
-    doc = fitz.open(pdf_path)
+def extract_sections_from_pdf(pdf_path, page_workers=1):
+    """
+    With page_workers > 1, large documents are split into that many page
+    ranges extracted in parallel; sections never span pages, so the result
+    is the same as a sequential pass.
+    """
+    if page_workers > 1:
+        return [sec for part in map_page_ranges(pdf_path, extract_page_range, page_workers) for sec in part]
+    return extract_page_range(pdf_path)
+
+def extract_page_range(pdf_path, page_numbers=None):
     sections = []
 
-    for page_num in range(len(doc)):
-        page = doc[page_num]
-        blocks = page.get_text("dict")["blocks"]
+    with fitz.open(pdf_path) as doc:
+        for page_num, spans in iter_page_spans(doc, page_numbers):
+            for block in group_blocks(spans):
+                lines = []
+                for line in block:
+                    line_text = " ".join([span.text for span in line]).strip()
+                    if line_text:
+                        lines.append(line_text)
 
-        for block in blocks:
-            if block["type"] != 0:
-                continue  # Skip non-text blocks
+                if not lines:
+                    continue
 
-            lines = []
-            for line in block["lines"]:
-                line_text = " ".join([span["text"] for span in line["spans"]]).strip()
-                if line_text:
-                    lines.append(line_text)
+                full_text = " ".join(lines)
+                if len(full_text) < 30:
+                    continue  # Skip very short text
 
-            if not lines:
-                continue
+                # Title cleanup and fallback
+                title_candidate = lines[0][:80]
+                section_title = title_candidate if is_valid_title(title_candidate) else full_text.split(".")[0][:80]
 
-            full_text = " ".join(lines)
-            if len(full_text) < 30:
-                continue  # Skip very short text
+                section = {
+                    "document": os.path.basename(pdf_path),
+                    "page": page_num,
+                    "section_title": section_title,
+                    "full_text": full_text
+                }
+                sections.append(section)
+
+    metrics.count("sections", len(sections))
+    return sections
 
-            # Title cleanup and fallback
-            title_candidate = lines[0][:80]
-            section_title = title_candidate if is_valid_title(title_candidate) else full_text.split(".")[0][:80]
+def extractor_fingerprint():
+    here = os.path.dirname(os.path.abspath(__file__))
+    return fingerprint(EXTRACTOR_VERSION, os.path.abspath(__file__), os.path.join(here, "pdf_spans.py"))
 
-            section = {
-                "document": os.path.basename(pdf_path),
-                "page": page_num + 1,
-                "section_title": section_title,
-                "full_text": full_text
-            }
-            sections.append(section)
+def open_cache(cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Returns a ResultCache for section lists, or None when caching is off.
+    """
+    if not cache_dir:
+        return None
+    return ResultCache(cache_dir, extractor_fingerprint(), max_bytes=max_bytes)
 
+def renamed(sections, pdf_path):
+    """
+    Cached sections are keyed by content, so a copy of a PDF under another
+    name gets the sections of the first one; point them at this file.
+    """
+    name = os.path.basename(pdf_path)
+    if sections and sections[0]["document"] != name:
+        return [{**sec, "document": name} for sec in sections]
     return sections
 
-def extract_all_sections(pdf_folder, filenames):
+def extract_all_sections(pdf_folder, filenames, cache=None, page_workers=1):
+    extract = partial(extract_sections_from_pdf, page_workers=page_workers)
     all_sections = []
     for file in filenames:
         path = os.path.join(pdf_folder, file)
         if os.path.exists(path):
-            sections = extract_sections_from_pdf(path)
+            if cache is not None:
+                sections = renamed(cache.get_or_compute(path, extract), path)
+            else:
+                sections = extract(path)
             all_sections.extend(sections)
         else:
             print(f"Warning: File not found -> {file}")
@@ -0,0 +1,329 @@
+"""
+Selectable CPU inference backends for the bi-encoder and cross-encoder.
+
+    torch       fp32 PyTorch (default)
+    torch-int8  PyTorch with dynamic int8 quantization of Linear layers
+    onnx        ONNX Runtime, fp32 export
+    onnx-int8   ONNX Runtime, dynamically quantized int8 export
+
+ONNX backends need a model directory produced by the `export` command:
+
+    python inference_backend.py export --out ../models/onnx
+    python inference_backend.py parity ../Collection_1/challenge1b_input.json \
+        ../Collection_1/PDFs --backend onnx-int8 --onnx-dir ../models/onnx
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+
+settings = {
+    "backend": os.environ.get("INFERENCE_BACKEND", "torch"),
+    "threads": int(os.environ["INFERENCE_THREADS"]) if os.environ.get("INFERENCE_THREADS") else None,
+    "onnx_dir": os.environ.get("ONNX_MODEL_DIR"),
+}
+
+BI_ENCODER_DIR = "bi_encoder"
+CROSS_ENCODER_DIR = "cross_encoder"
+
+
+def configure(backend=None, threads=None, onnx_dir=None):
+    """
+    Selects the backend used by models loaded afterwards.
+    """
+    if backend is not None:
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown inference backend '{backend}'")
+        settings["backend"] = backend
+    if threads is not None:
+        settings["threads"] = threads
+    if onnx_dir is not None:
+        settings["onnx_dir"] = onnx_dir
+
+
+def model_key(model_name):
+    """
+    Identifies the model's outputs under the current backend, for keying
+    stored embeddings and cached scores: quantized or exported models give
+    slightly different results than fp32 PyTorch, so they must not mix.
+    """
+    backend = settings["backend"]
+    return model_name if backend == "torch" else f"{model_name}.{backend}"
+
+
+def add_backend_args(parser):
+    parser.add_argument("--backend", choices=BACKENDS, default=settings["backend"],
+                        help="inference backend for both models (default: torch fp32)")
+    parser.add_argument("--threads", type=int, default=settings["threads"],
+                        help="CPU threads used for inference")
+    parser.add_argument("--onnx-dir", default=settings["onnx_dir"],
+                        help="directory written by `inference_backend.py export`")
+
+
+def configure_backend(args):
+    configure(backend=args.backend, threads=args.threads, onnx_dir=args.onnx_dir)
+
+
+def _set_torch_threads():
+    if settings["threads"]:
+        import torch
+        torch.set_num_threads(settings["threads"])
+
+
+def _quantize_torch(module):
+    import torch
+    return torch.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _onnx_path(kind):
+    if not settings["onnx_dir"]:
+        raise ValueError("ONNX backends need --onnx-dir / ONNX_MODEL_DIR (see `export`)")
+    return os.path.join(settings["onnx_dir"], kind)
+
+
+def _onnx_session(model_dir, int8):
+    import onnxruntime as ort
+    options = ort.SessionOptions()
+    if settings["threads"]:
+        options.intra_op_num_threads = settings["threads"]
+    model_file = os.path.join(model_dir, "model_int8.onnx" if int8 else "model.onnx")
+    return ort.InferenceSession(model_file, options, providers=["CPUExecutionProvider"])
+
+
+def _onnx_inputs(session, encoded):
+    names = {i.name for i in session.get_inputs()}
+    return {k: v.astype(np.int64) for k, v in encoded.items() if k in names}
+
+
+class OnnxBiEncoder:
+    """
+    ONNX Runtime replacement for SentenceTransformer.encode: tokenizes,
+    runs the exported transformer and applies the exported pooling.
+    """
+
+    def __init__(self, model_dir, int8=False):
+        from transformers import AutoTokenizer
+        with open(os.path.join(model_dir, "config.json"), encoding="utf-8") as f:
+            self.config = json.load(f)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.session = _onnx_session(model_dir, int8)
+
+    def encode(self, sentences, batch_size=32, convert_to_numpy=True, normalize_embeddings=False, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        out = np.zeros((len(texts), self.config["dim"]), dtype=np.float32)
+        order = sorted(range(len(texts)), key=lambda i: -len(texts[i]))
+        for start in range(0, len(order), batch_size):
+            idx = order[start:start + batch_size]
+            encoded = self.tokenizer([texts[i] for i in idx], padding=True, truncation=True,
+                                     max_length=self.config["max_seq_length"], return_tensors="np")
+            hidden = self.session.run(None, _onnx_inputs(self.session, encoded))[0]
+            if self.config["pooling"] == "cls":
+                pooled = hidden[:, 0]
+            else:
+                mask = encoded["attention_mask"][..., None].astype(np.float32)
+                pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            out[idx] = pooled
+        if normalize_embeddings:
+            norms = np.linalg.norm(out, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            out = out / norms
+        return out[0] if single else out
+
+
+class OnnxCrossEncoder:
+    """
+    ONNX Runtime replacement for CrossEncoder.predict.
+    """
+
+    def __init__(self, model_dir, int8=False):
+        from transformers import AutoTokenizer
+        with open(os.path.join(model_dir, "config.json"), encoding="utf-8") as f:
+            self.config = json.load(f)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.session = _onnx_session(model_dir, int8)
+
+    def predict(self, sentences, batch_size=32, **kwargs):
+        scores = []
+        for start in range(0, len(sentences), batch_size):
+            batch = sentences[start:start + batch_size]
+            encoded = self.tokenizer([q for q, _ in batch], [p for _, p in batch], padding=True,
+                                     truncation="longest_first", max_length=self.config["max_length"],
+                                     return_tensors="np")
+            logits = self.session.run(None, _onnx_inputs(self.session, encoded))[0][:, 0]
+            if self.config["activation"] == "sigmoid":
+                logits = 1.0 / (1.0 + np.exp(-logits))
+            scores.extend(logits.tolist())
+        return np.array(scores, dtype=np.float32)
+
+
+def load_bi_encoder(model_name):
+    backend = settings["backend"]
+    if backend.startswith("onnx"):
+        return OnnxBiEncoder(_onnx_path(BI_ENCODER_DIR), int8=backend == "onnx-int8")
+    from sentence_transformers import SentenceTransformer
+    _set_torch_threads()
+    model = SentenceTransformer(model_name)
+    if backend == "torch-int8":
+        model = _quantize_torch(model)
+    return model
+
+
+def load_cross_encoder(model_name):
+    backend = settings["backend"]
+    if backend.startswith("onnx"):
+        return OnnxCrossEncoder(_onnx_path(CROSS_ENCODER_DIR), int8=backend == "onnx-int8")
+    from sentence_transformers import CrossEncoder
+    _set_torch_threads()
+    model = CrossEncoder(model_name)
+    if backend == "torch-int8":
+        model.model = _quantize_torch(model.model)
+    return model
+
+
+def _export_onnx(model, example, input_names, output_name, path):
+    import torch
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes[output_name] = {0: "batch"}
+    with torch.no_grad():
+        torch.onnx.export(model, tuple(example[name] for name in input_names), path,
+                          input_names=input_names, output_names=[output_name],
+                          dynamic_axes=dynamic_axes, opset_version=14)
+
+
+def _quantize_onnx(model_dir):
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    quantize_dynamic(os.path.join(model_dir, "model.onnx"), os.path.join(model_dir, "model_int8.onnx"),
+                     weight_type=QuantType.QInt8)
+
+
+def export(out_dir, bi_encoder_name, cross_encoder_name):
+    """
+    Exports both models to ONNX (fp32 and int8) with their tokenizers and
+    the pooling/activation settings the ONNX backends need.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer, CrossEncoder
+
+    bi_dir = os.path.join(out_dir, BI_ENCODER_DIR)
+    os.makedirs(bi_dir, exist_ok=True)
+    bi = SentenceTransformer(bi_encoder_name, device="cpu")
+    transformer = bi[0].auto_model.eval()
+    example = bi.tokenizer(["an example sentence"], return_tensors="pt")
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in example]
+    _export_onnx(transformer, example, input_names, "last_hidden_state", os.path.join(bi_dir, "model.onnx"))
+    bi.tokenizer.save_pretrained(bi_dir)
+    with open(os.path.join(bi_dir, "config.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "model": bi_encoder_name,
+            "pooling": bi[1].get_pooling_mode_str(),
+            "max_seq_length": bi.max_seq_length,
+            "dim": bi.get_sentence_embedding_dimension(),
+        }, f, indent=2)
+    _quantize_onnx(bi_dir)
+
+    ce_dir = os.path.join(out_dir, CROSS_ENCODER_DIR)
+    os.makedirs(ce_dir, exist_ok=True)
+    ce = CrossEncoder(cross_encoder_name, device="cpu")
+    classifier = ce.model.eval()
+    example = ce.tokenizer(["a query"], ["a passage"], return_tensors="pt")
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in example]
+    _export_onnx(classifier, example, input_names, "logits", os.path.join(ce_dir, "model.onnx"))
+    ce.tokenizer.save_pretrained(ce_dir)
+    activation = getattr(ce, "activation_fct", None) or getattr(ce, "activation_fn", None)
+    with open(os.path.join(ce_dir, "config.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "model": cross_encoder_name,
+            "max_length": ce.max_length or ce.tokenizer.model_max_length,
+            "activation": "sigmoid" if isinstance(activation, torch.nn.Sigmoid) else "identity",
+        }, f, indent=2)
+    _quantize_onnx(ce_dir)
+
+
+def parity(input_json, pdf_folder, backend, k=10):
+    """
+    Ranks one collection with the fp32 torch models and with `backend`
+    and reports how much the top-k sections and the re-ranked top-5 agree.
+    """
+    import embedder
+    import ranker
+    from extract_sections import extract_all_sections
+
+    with open(input_json, encoding="utf-8") as f:
+        input_data = json.load(f)
+    persona = input_data["persona"]["role"]
+    job = input_data["job_to_be_done"]["task"]
+    filenames = [doc["filename"] for doc in input_data["documents"]]
+    sections = extract_all_sections(pdf_folder, filenames)
+    texts = [sec["full_text"] for sec in sections]
+    query = embedder.query_text(persona, job)
+    cross_query = f"Persona: {persona} Job: {job}"
+
+    results = {}
+    for name in ("torch", backend):
+        configure(backend=name)
+        bi = load_bi_encoder(embedder.MODEL_NAME)
+        ce = load_cross_encoder(ranker.CROSS_ENCODER_NAME)
+        start = time.perf_counter()
+        vecs = bi.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+        query_vec = bi.encode([query], convert_to_numpy=True, normalize_embeddings=True)[0]
+        encode_time = time.perf_counter() - start
+        top = ranker.rank_sections(sections, vecs, query_vec, top_k=k)
+        start = time.perf_counter()
+        cross_scores = ce.predict([(cross_query, sec["full_text"]) for sec in top])
+        cross_time = time.perf_counter() - start
+        for sec, score in zip(top, cross_scores):
+            sec["score"] += 0.5 * float(score)
+        reranked = sorted(top, key=lambda x: x["score"], reverse=True)[:5]
+        results[name] = {
+            "top_k": [(s["document"], s["page"], s["section_title"]) for s in top],
+            "top_5": [(s["document"], s["page"], s["section_title"]) for s in reranked],
+            "vectors": vecs,
+            "encode_s": encode_time,
+            "cross_s": cross_time,
+        }
+
+    ref, new = results["torch"], results[backend]
+    cosine = np.sum(ref["vectors"] * new["vectors"], axis=1)
+    return {
+        "backend": backend,
+        "sections": len(sections),
+        f"top_{k}_overlap": len(set(ref["top_k"]) & set(new["top_k"])) / max(1, len(ref["top_k"])),
+        "top_5_overlap": len(set(ref["top_5"]) & set(new["top_5"])) / max(1, len(ref["top_5"])),
+        "top_5_same_order": ref["top_5"] == new["top_5"],
+        "embedding_cosine_min": float(cosine.min()) if len(cosine) else 1.0,
+        "encode_seconds": {"torch": ref["encode_s"], backend: new["encode_s"]},
+        "cross_encode_seconds": {"torch": ref["cross_s"], backend: new["cross_s"]},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export models for and validate the inference backends.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    exp = sub.add_parser("export", help="export both models to ONNX (fp32 and int8)")
+    exp.add_argument("--out", required=True)
+    par = sub.add_parser("parity", help="compare a backend's ranking against fp32 torch")
+    par.add_argument("input_json")
+    par.add_argument("pdf_folder")
+    par.add_argument("--backend", choices=BACKENDS[1:], required=True)
+    par.add_argument("--onnx-dir", default=settings["onnx_dir"])
+    par.add_argument("--threads", type=int, default=settings["threads"])
+    par.add_argument("--k", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    import embedder
+    import ranker
+    if args.command == "export":
+        export(args.out, embedder.MODEL_NAME, ranker.CROSS_ENCODER_NAME)
+        print(f"Exported models to {args.out}", file=sys.stderr)
+    else:
+        configure(threads=args.threads, onnx_dir=args.onnx_dir)
+        print(json.dumps(parity(args.input_json, args.pdf_folder, args.backend, k=args.k), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Streaming ingestion: PDFs are parsed in a process pool while the calling
+thread embeds the sections of every document that is already done, so
+parsing and model inference overlap instead of running back to back.
+
+    parser pool --(bounded queue)--> micro-batching embedder --> ordered assembly
+
+The queue between the two is bounded, so parsing pauses when embedding
+falls behind; results are reassembled in input order, so the sections
+match extract_all_sections and the vectors match embedding them in one go.
+"""
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+import metrics
+from extract_sections import extract_sections_from_pdf, renamed
+from embedding_store import texts_digest
+from result_cache import file_digest
+
+_DONE = object()
+
+
+def _parse_documents(pdf_folder, filenames, cache, workers, parsed, errors, stop):
+    """
+    Producer thread: keeps `workers` documents parsing and puts
+    (position, filename, sections) on `parsed` as each one finishes.
+    Once `stop` is set, queued documents are dropped and only the ones
+    already parsing are waited for.
+    """
+    try:
+        todo = iter(enumerate(filenames))
+        pending = {}
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            def submit_next():
+                if stop.is_set():
+                    return
+                for position, name in todo:
+                    path = os.path.join(pdf_folder, name)
+                    if not os.path.exists(path):
+                        print(f"Warning: File not found -> {name}")
+                        continue
+                    digest = file_digest(path) if cache is not None else None
+                    cached = cache.get(digest) if cache is not None else None
+                    if cached is not None:
+                        parsed.put((position, name, renamed(cached, path)))
+                        continue
+                    pending[pool.submit(extract_sections_from_pdf, path)] = (position, name, digest)
+                    return
+
+            for _ in range(workers):
+                submit_next()
+            while pending:
+                if stop.is_set():
+                    for future in pending:
+                        future.cancel()
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    position, name, digest = pending.pop(future)
+                    sections = future.result()
+                    if cache is not None:
+                        cache.put(digest, sections)
+                    parsed.put((position, name, sections))  # blocks while the embedder is behind
+                    submit_next()
+    except BaseException as e:
+        errors.append(e)
+    finally:
+        parsed.put(_DONE)
+
+
+def ingest(pdf_folder, filenames, embed_fn, cache=None, store=None, workers=None, queue_size=4,
+           batch_texts=64):
+    """
+    Extracts and embeds the sections of `filenames` with parsing and
+    embedding overlapped. Returns (sections, vectors) in the same order as
+    extract_all_sections. Each embed_fn call covers every parsed document
+    waiting at that moment, up to about `batch_texts` texts; documents the
+    embedding `store` already has are not re-embedded.
+    """
+    workers = workers or os.cpu_count() or 1
+    parsed = queue.Queue(maxsize=queue_size)
+    errors = []
+    stop = threading.Event()
+    producer = threading.Thread(target=_parse_documents, daemon=True,
+                                args=(pdf_folder, filenames, cache, workers, parsed, errors, stop))
+    producer.start()
+
+    done = {}  # position -> (sections, vectors)
+
+    def embed_batch(batch):
+        with metrics.stage("embed"):
+            vectors = embed_fn([sec["full_text"] for _, _, sections, _ in batch for sec in sections])
+        offset = 0
+        for position, name, sections, key in batch:
+            block = np.asarray(vectors[offset:offset + len(sections)], dtype=np.float32)
+            offset += len(sections)
+            if key is not None:
+                store.append(*key, block, source=os.path.abspath(os.path.join(pdf_folder, name)))
+            done[position] = (sections, block)
+
+    finished = False
+    try:
+        while not finished:
+            batch = []
+            pending_texts = 0
+            item = parsed.get()
+            # Take everything already parsed, up to one micro-batch
+            while True:
+                if item is _DONE:
+                    finished = True
+                    break
+                position, name, sections = item
+                key = stored = None
+                if store is not None and sections:
+                    texts = [sec["full_text"] for sec in sections]
+                    key = (file_digest(os.path.join(pdf_folder, name)), texts_digest(texts))
+                    stored = store.lookup(*key)
+                if stored is not None:
+                    done[position] = (sections, np.asarray(stored))
+                elif sections:
+                    batch.append((position, name, sections, key))
+                    pending_texts += len(sections)
+                if pending_texts >= batch_texts:
+                    break
+                try:
+                    item = parsed.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                embed_batch(batch)
+    finally:
+        if not finished:
+            # The embedder failed: stop the producer and unblock its puts
+            stop.set()
+            while parsed.get() is not _DONE:
+                pass
+        producer.join()
+    if errors:
+        raise errors[0]
+
+    all_sections = []
+    blocks = []
+    for position in sorted(done):
+        sections, vectors = done[position]
+        all_sections.extend(sections)
+        blocks.append(vectors)
+    if not blocks:
+        return all_sections, np.zeros((0, 0), dtype=np.float32)
+    return all_sections, np.concatenate(blocks)
@@ -0,0 +1,132 @@
+"""
+BM25 inverted index over section texts, used to prefilter sections before
+they are embedded and ranked.
+
+Postings are stored compactly as flat arrays: for term t, its documents
+are doc_ids[offsets[t]:offsets[t + 1]] with matching term frequencies in
+tfs. An index is saved as one .npz file named after a digest of the
+section texts, so each collection's index is built once and reloaded.
+"""
+import os
+import re
+import numpy as np
+from embedding_store import texts_digest
+from vector_index import top_k
+
+TOKEN = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the to was were will with "
+    "this these those you your we our i me my they their them he she his her not no do does can "
+    "persona job".split()
+)
+
+
+def tokenize(text):
+    return [t for t in TOKEN.findall(text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+class BM25Index:
+    def __init__(self, terms, offsets, doc_ids, tfs, doc_lengths, k1=1.5, b=0.75):
+        self.terms = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        n = len(doc_lengths)
+        df = np.diff(offsets).astype(np.float64)
+        self.idf = np.log(1.0 + (n - df + 0.5) / (df + 0.5))
+        avgdl = doc_lengths.mean() if n else 1.0
+        self.length_norm = k1 * (1.0 - b + b * doc_lengths / (avgdl or 1.0))
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    @classmethod
+    def build(cls, texts):
+        postings = {}
+        doc_lengths = np.zeros(len(texts), dtype=np.int32)
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths[doc_id] = len(tokens)
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                postings.setdefault(token, []).append((doc_id, tf))
+
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(postings[t]) for t in terms])
+        doc_ids = np.empty(offsets[-1], dtype=np.int32)
+        tfs = np.empty(offsets[-1], dtype=np.float32)
+        for i, term in enumerate(terms):
+            pairs = postings[term]
+            doc_ids[offsets[i]:offsets[i + 1]] = [d for d, _ in pairs]
+            tfs[offsets[i]:offsets[i + 1]] = [tf for _, tf in pairs]
+        return cls(terms, offsets, doc_ids, tfs, doc_lengths)
+
+    def save(self, path):
+        tmp_path = path + ".tmp.npz"
+        terms = sorted(self.terms, key=self.terms.get)
+        np.savez(tmp_path, terms=np.array(terms, dtype=str), offsets=self.offsets,
+                 doc_ids=self.doc_ids, tfs=self.tfs, doc_lengths=self.doc_lengths)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["terms"].tolist(), data["offsets"], data["doc_ids"], data["tfs"],
+                       data["doc_lengths"])
+
+    def scores(self, query):
+        """
+        BM25 score of every section for the query text.
+        """
+        scores = np.zeros(len(self), dtype=np.float64)
+        for token in set(tokenize(query)):
+            t = self.terms.get(token)
+            if t is None:
+                continue
+            start, end = self.offsets[t], self.offsets[t + 1]
+            docs = self.doc_ids[start:end]
+            tf = self.tfs[start:end]
+            # A term occurs once per posting list, so docs are unique
+            scores[docs] += self.idf[t] * tf * (self.k1 + 1) / (tf + self.length_norm[docs])
+        return scores
+
+
+def load_or_build(texts, index_dir=None):
+    """
+    Returns the BM25 index for these section texts, reusing the copy saved
+    in index_dir when the texts are unchanged.
+    """
+    if not index_dir:
+        return BM25Index.build(texts)
+    path = os.path.join(index_dir, f"bm25-{texts_digest(texts)[:32]}.npz")
+    if os.path.exists(path):
+        return BM25Index.load(path)
+    index = BM25Index.build(texts)
+    os.makedirs(index_dir, exist_ok=True)
+    index.save(path)
+    return index
+
+
+def prefilter(index, query, depth, min_matches=20):
+    """
+    Returns (ids, lexical scores) of the `depth` best sections that share
+    at least one term with the query, in document order, with scores
+    scaled to [0, 1]. Returns None when fewer than min_matches sections
+    share a term: the query's wording does not match the collection, so
+    dense ranking over everything is safer. Also None for an empty index
+    or a query with no matching term.
+    """
+    scores = index.scores(query)
+    matches = np.count_nonzero(scores)
+    if matches == 0 or matches < min(min_matches, len(scores)):
+        return None
+    ids = top_k(scores, depth)
+    ids = np.sort(ids[scores[ids] > 0])
+    return ids, scores[ids] / scores[ids].max()
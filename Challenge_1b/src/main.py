@@ -1,50 +1,223 @@
 import json
 import os
 import sys
+import time
+import argparse
+from functools import partial
+from contextlib import contextmanager
 from datetime import datetime
-from extract_sections import extract_all_sections
-from embedder import embed_query, embed_sections
-from ranker import rank_sections, extract_subsections, diversify_sections, re_rank_with_cross_encoder
-from sentence_transformers import SentenceTransformer
-
-# Constants
-INPUT_JSON = sys.argv[1]
-OUTPUT_JSON = sys.argv[2]
-PDF_FOLDER = sys.argv[3]
-
-def main():
-    # 1. Load input JSON
-    with open(INPUT_JSON, "r", encoding="utf-8") as f:
-        input_data = json.load(f)
-
-    # 2. Extract persona and job
+import metrics
+from inference_backend import add_backend_args, configure_backend, model_key
+
+# PDF parsing, NumPy and the models are imported by the stages that need
+# them, so --help, bad input and --extract-only runs start quickly
+
+def parse_weights(text):
+    from ranker import DEFAULT_WEIGHTS
+    weights = {}
+    for item in text.split(","):
+        name, _, value = item.partition("=")
+        if name.strip() not in DEFAULT_WEIGHTS:
+            raise argparse.ArgumentTypeError(f"unknown weight '{name.strip()}'")
+        weights[name.strip()] = float(value)
+    return weights
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Rank PDF sections for a persona and job-to-be-done.")
+    parser.add_argument("input_json")
+    parser.add_argument("output_json")
+    parser.add_argument("pdf_folder")
+    parser.add_argument("--cache-dir", default=os.environ.get("SECTION_CACHE_DIR"),
+                        help="reuse extracted sections of unchanged PDFs from this directory")
+    parser.add_argument("--extract-only", action="store_true",
+                        help="only extract sections and write them to output_json; no models are loaded")
+    parser.add_argument("--page-workers", type=int, default=1,
+                        help="extract each large PDF in page ranges across this many processes (0 = one per CPU)")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="parse PDFs in a process pool and embed each one as soon as it is parsed")
+    parser.add_argument("--parse-workers", type=int, default=0,
+                        help="parser processes for --pipeline (0 = one per CPU)")
+    parser.add_argument("--lexical-depth", type=int, default=None,
+                        help="only embed and rank the N best BM25 matches for the query")
+    parser.add_argument("--lexical-dir", default=os.environ.get("LEXICAL_INDEX_DIR"),
+                        help="persist BM25 indexes here, one per distinct set of sections")
+    parser.add_argument("--diversify", action="store_true",
+                        help="pick ranked sections by maximal marginal relevance to avoid near-duplicates")
+    parser.add_argument("--diversity", type=float, default=0.3,
+                        help="with --diversify, weight of novelty against relevance (0-1)")
+    parser.add_argument("--max-per-doc", type=int, default=2,
+                        help="with --diversify, most sections taken from one PDF (0 = no cap)")
+    parser.add_argument("--corpus", default=None,
+                        help="keep the extracted sections as a memory-mapped columnar corpus in this directory")
+    parser.add_argument("--embedding-store", default=os.environ.get("EMBEDDING_STORE_DIR"),
+                        help="persist section embeddings here and only embed new or changed PDFs")
+    parser.add_argument("--index", choices=["exact", "ivf"], default=None,
+                        help="retrieve ranking candidates through a vector index instead of a full scan")
+    parser.add_argument("--candidates", type=int, default=100,
+                        help="number of nearest sections the index passes to hybrid scoring")
+    parser.add_argument("--weights", type=parse_weights, default=None,
+                        help="hybrid score weights, e.g. similarity=0.7,length=0.2,position=0.1")
+    parser.add_argument("--rerank-depth", type=int, default=None,
+                        help="candidates passed to the cross-encoder (default: all ranked sections)")
+    parser.add_argument("--rerank-cutoff", type=float, default=None,
+                        help="skip candidates trailing the last kept score by more than this "
+                             "(a heuristic: cross-encoder scores are unbounded)")
+    parser.add_argument("--rerank-margin", type=float, default=None,
+                        help="skip the cross-encoder when consecutive top scores differ by at least this")
+    parser.add_argument("--rerank-window", type=int, default=None,
+                        help="score long sections on their most relevant window of this many words")
+    parser.add_argument("--cross-cache", default=os.environ.get("CROSS_SCORE_CACHE"),
+                        help="JSON file caching cross-encoder scores across runs")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running and update output_json whenever the PDFs or input_json change")
+    parser.add_argument("--interval", type=float, default=2.0,
+                        help="with --watch, seconds between scans of pdf_folder")
+    parser.add_argument("--manifest", default=None,
+                        help="with --watch, processed-file manifest (default: .watch/manifest.json next to output_json)")
+    parser.add_argument("--metrics", default=None,
+                        help="write per-stage timings, counters and peak memory here (.json, or .prom for Prometheus)")
+    parser.add_argument("--profile", default=None,
+                        help="profile the run into this file (.prof for cProfile, .html/.txt for pyinstrument)")
+    add_backend_args(parser)
+    return parser.parse_args(argv)
+
+def rerank_options(args):
+    return {
+        "depth": args.rerank_depth,
+        "cutoff": args.rerank_cutoff,
+        "margin": args.rerank_margin,
+        "window_words": args.rerank_window,
+    }
+
+def diversify_options(args):
+    if not args.diversify:
+        return None
+    return {"diversity": args.diversity, "max_per_doc": args.max_per_doc}
+
+@contextmanager
+def timed(timings, stage):
+    start = time.perf_counter()
+    try:
+        with metrics.stage(stage):
+            yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+def run_pipeline(input_data, pdf_folder, cache=None, store=None, timings=None,
+                 index_kind=None, candidates=100, weights=None, rerank=None, cross_cache=None,
+                 page_workers=1, parse_workers=None, lexical_depth=None, lexical_dir=None,
+                 diversify=None, corpus_dir=None, indexes=None):
+    """
+    Runs extraction, embedding, ranking and subsection analysis for one
+    input JSON and returns the output JSON. Seconds spent in each stage are
+    accumulated into `timings` when a dict is passed. With parse_workers
+    set, PDFs are parsed by that many processes while finished ones are
+    embedded (see ingest.py). With lexical_depth set, only the best BM25
+    matches for the query are embedded and ranked (see lexical_index.py).
+    `diversify` (options for ranker.diversify_sections) picks the ranked
+    candidates by maximal marginal relevance from a deeper pool. With
+    corpus_dir, sections are read from (or saved to) a columnar corpus
+    there instead of being held as dicts (see section_corpus.py).
+    `indexes` is a dict that keeps vector indexes between calls; they are
+    also saved in the embedding store.
+    See batch_queries.py for many queries over one collection.
+    """
+    from extract_sections import extract_all_sections
+    from embedder import embed_query, embed_sections
+    from embedding_store import embed_sections_incremental, texts_digest
+    import vector_index
+    from ranker import rank_sections, diversify_sections
+    from section_corpus import load_or_extract, section_texts
+
+    if timings is None:
+        timings = {}
+
+    # 1. Extract persona and job
     persona_text = input_data["persona"]["role"]
     job_text = input_data["job_to_be_done"]["task"]
 
-    # 3. Extract PDF filenames
+    # 2. Extract PDF filenames
     filenames = [doc["filename"] for doc in input_data["documents"]]
 
-    # 4. Extract sections
-    sections = extract_all_sections(PDF_FOLDER, filenames)
+    lexical = None
+    if parse_workers and not lexical_depth:
+        # 3-4. Extract and embed sections, overlapped
+        from ingest import ingest
+        with timed(timings, "ingest"):
+            sections, section_vecs = ingest(pdf_folder, filenames, embed_sections, cache=cache,
+                                            store=store, workers=parse_workers)
+        with timed(timings, "embed"):
+            query_vec = embed_query(persona_text, job_text)
+    else:
+        # 3. Extract sections
+        with timed(timings, "extract"):
+            if corpus_dir:
+                sections = load_or_extract(corpus_dir, pdf_folder, filenames,
+                                           partial(extract_all_sections, cache=cache, page_workers=page_workers))
+            else:
+                sections = extract_all_sections(pdf_folder, filenames, cache=cache, page_workers=page_workers)
+
+        # Keep only sections sharing vocabulary with the query
+        if lexical_depth:
+            from embedder import query_text
+            import lexical_index
+            with timed(timings, "lexical"):
+                bm25 = lexical_index.load_or_build(section_texts(sections), lexical_dir)
+                matches = lexical_index.prefilter(bm25, query_text(persona_text, job_text), lexical_depth)
+                if matches is not None:
+                    keep, lexical = matches
+                    sections = [sections[i] for i in keep]
 
-    # 5. Load model and compute embeddings
-    model = SentenceTransformer("multi-qa-mpnet-base-dot-v1")
-    query_vec = embed_query(persona_text, job_text)
-    section_texts = [sec["full_text"] for sec in sections]
-    section_vecs = embed_sections(section_texts)
+        # 4. Compute embeddings
+        with timed(timings, "embed"):
+            query_vec = embed_query(persona_text, job_text)
+            if store is not None and not lexical_depth:
+                section_vecs = embed_sections_incremental(store, pdf_folder, sections, embed_sections)
+            else:
+                section_vecs = embed_sections(section_texts(sections))
 
-    # 6. Rank sections and get top results
-    initial_top = rank_sections(sections, section_vecs, query_vec, top_k=10)
-    top_sections = re_rank_with_cross_encoder(initial_top, f"Persona: {persona_text} Job: {job_text}")
+    # 5. Rank sections and get top results
+    with timed(timings, "rank"):
+        index = None
+        if index_kind:
+            index = vector_index.load_or_build(
+                section_vecs, index_kind, texts_digest(section_texts(sections)),
+                # A lexical subset depends on the query, so it is not worth keeping
+                index_dir=os.path.join(store.path, "indexes") if store is not None and lexical is None else None,
+                loaded=indexes)
+        pool = diversify.get("pool", 50) if diversify else 10
+        initial_top = rank_sections(sections, section_vecs, query_vec, top_k=pool,
+                                    index=index, candidates=candidates, weights=weights, lexical=lexical)
+    if diversify:
+        with timed(timings, "diversify"):
+            pool_vecs = section_vecs[[sec["row"] for sec in initial_top]]
+            initial_top = diversify_sections(initial_top, pool_vecs, top_n=10,
+                                             max_per_doc=diversify.get("max_per_doc"),
+                                             diversity=diversify.get("diversity", 0.3))
+    return refine_and_format(sections, section_vecs, initial_top, query_vec, persona_text, job_text,
+                             filenames, timings, rerank=rerank, cross_cache=cross_cache)
 
-    # 7. Get top refined subsections from each section
-    all_subsections = []
-    for sec in top_sections:
-        subs = extract_subsections(sec, query_vec, model)
-        all_subsections.extend(subs)
+def refine_and_format(sections, section_vecs, initial_top, query_vec, persona_text, job_text,
+                      filenames, timings, rerank=None, cross_cache=None):
+    """
+    Re-ranks one query's top sections, extracts their subsections and
+    builds the output JSON.
+    """
+    import embedder
+    from ranker import extract_subsections_batch, re_rank_with_cross_encoder
 
-    # 8. Format output
-    output = {
+    with timed(timings, "rerank"):
+        top_sections = re_rank_with_cross_encoder(initial_top, f"Persona: {persona_text} Job: {job_text}",
+                                                  cache=cross_cache, **(rerank or {}))
+
+    # Get top refined subsections from each section
+    with timed(timings, "subsections"):
+        known_vectors = {sec["full_text"]: section_vecs[sec["row"]] for sec in top_sections}
+        all_subsections = extract_subsections_batch(top_sections, query_vec, embedder.get_model(),
+                                                    known_vectors=known_vectors)
+
+    # Format output
+    return {
         "metadata": {
             "input_documents": filenames,
             "persona": persona_text,
@@ -62,11 +235,109 @@ def main():
         "subsection_analysis": all_subsections
     }
 
-    # 9. Save output
-    with open(OUTPUT_JSON, "w", encoding="utf-8") as f:
-        json.dump(output, f, indent=2)
+def extract_only(input_data, pdf_folder, cache=None, page_workers=1, corpus_dir=None):
+    """
+    Returns the extracted sections of the input's documents without
+    loading any model (also saving them as a corpus if corpus_dir is set).
+    """
+    from extract_sections import extract_all_sections
+    from section_corpus import load_or_extract
+
+    filenames = [doc["filename"] for doc in input_data["documents"]]
+    extract = partial(extract_all_sections, cache=cache, page_workers=page_workers)
+    sections = load_or_extract(corpus_dir, pdf_folder, filenames, extract) if corpus_dir else \
+        extract(pdf_folder, filenames)
+    return {
+        "metadata": {"input_documents": filenames},
+        "sections": list(sections)
+    }
+
+def write_json_atomic(data, path):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_backend(args)
+    if args.metrics:
+        metrics.enable()
+
+    from extract_sections import open_cache
+
+    own_store = False
+    if args.watch:
+        # Watch mode always keeps sections and embeddings between updates
+        state_dir = os.path.join(os.path.dirname(os.path.abspath(args.output_json)), ".watch")
+        own_store = not args.embedding_store
+        args.cache_dir = args.cache_dir or os.path.join(state_dir, "sections")
+        if not args.extract_only:
+            args.embedding_store = args.embedding_store or os.path.join(state_dir, "embeddings")
+
+    cache = open_cache(args.cache_dir)
+    page_workers = args.page_workers or os.cpu_count() or 1
+    store = cross_cache = None
+    indexes = {}
+    if not args.extract_only:
+        from embedder import MODEL_NAME
+        from embedding_store import EmbeddingStore
+        from ranker import CrossScoreCache
+
+        store = EmbeddingStore(args.embedding_store, model_key(MODEL_NAME)) if args.embedding_store else None
+        cross_cache = CrossScoreCache(args.cross_cache) if args.cross_cache else None
+
+    def run_once():
+        with open(args.input_json, "r", encoding="utf-8") as f:
+            input_data = json.load(f)
+        with metrics.profiled(args.profile):
+            if args.extract_only:
+                output = extract_only(input_data, args.pdf_folder, cache=cache, page_workers=page_workers,
+                                      corpus_dir=args.corpus)
+            else:
+                output = run_pipeline(input_data, args.pdf_folder, cache=cache, store=store,
+                                      index_kind=args.index, candidates=args.candidates, weights=args.weights,
+                                      rerank=rerank_options(args), cross_cache=cross_cache,
+                                      page_workers=page_workers,
+                                      parse_workers=(args.parse_workers or os.cpu_count() or 1) if args.pipeline else None,
+                                      lexical_depth=args.lexical_depth, lexical_dir=args.lexical_dir,
+                                      diversify=diversify_options(args), corpus_dir=args.corpus,
+                                      indexes=indexes)
+        if cross_cache is not None:
+            cross_cache.save()
+        if cache is not None:
+            cache.evict()
+        write_json_atomic(output, args.output_json)
+        if args.metrics:
+            metrics.write_report(args.metrics)
+        print(f"\nOutput saved to {args.output_json}")
+
+    if not args.watch:
+        run_once()
+        return
+
+    from watch import Manifest, pdf_files, watch
+
+    # Any change re-runs the pipeline; the section cache and embedding
+    # store make sure only new or modified PDFs are parsed and embedded
+    manifest = Manifest(args.manifest or os.path.join(state_dir, "manifest.json"))
+
+    def on_change(changed, removed):
+        try:
+            run_once()
+        except Exception as e:
+            # e.g. a half-written input JSON or a PDF deleted mid-run; the
+            # previous output stays in place and the paths are retried
+            print(f"Update failed -> {type(e).__name__}: {e}; will retry", file=sys.stderr)
+            return changed + removed
+        if store is not None and own_store:
+            # The store under .watch only serves this folder, so vectors of
+            # replaced or deleted PDFs can be dropped
+            from embedding_store import pdf_hashes
+            store.compact_if_stale(pdf_hashes([args.pdf_folder]))
 
-    print(f"\nOutput saved to {OUTPUT_JSON}")
+    watch(lambda: pdf_files(args.pdf_folder) + [os.path.abspath(args.input_json)], manifest,
+          on_change, interval=args.interval)
 
 if __name__ == "__main__":
     main()
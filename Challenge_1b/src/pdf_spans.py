@@ -0,0 +1,144 @@
+import fitz  # PyMuPDF
+import multiprocessing
+import metrics
+
+# Shorter documents are not worth starting worker processes for
+PARALLEL_MIN_PAGES = 40
+
+
+class Span:
+    """
+    One text span of a page: a compact record in place of PyMuPDF's nested
+    span dicts. `block` and `line` are the span's position in the page's
+    block/line structure so consumers can regroup spans without the dict.
+    """
+    __slots__ = ('text', 'size', 'font', 'bold', 'page', 'block', 'line', 'x0', 'y0', 'x1', 'y1')
+
+    def __init__(self, text, size, font, bold, page, block, line, x0, y0, x1, y1):
+        self.text = text
+        self.size = size
+        self.font = font
+        self.bold = bold
+        self.page = page
+        self.block = block
+        self.line = line
+        self.x0 = x0
+        self.y0 = y0
+        self.x1 = x1
+        self.y1 = y1
+
+    def _fields(self):
+        return (self.text, self.size, self.font, self.bold, self.page,
+                self.block, self.line, self.x0, self.y0, self.x1, self.y1)
+
+    def copy(self):
+        return Span(*self._fields())
+
+    def __reduce__(self):
+        # Plain tuples pickle much faster than slot state when page-range
+        # workers send their spans back
+        return Span, self._fields()
+
+
+def is_bold_font(font_name):
+    return 'Bold' in font_name or 'bold' in font_name
+
+
+def page_spans(page, page_num):
+    """
+    Walks one page's text once and returns its spans in reading order.
+    Spans are returned unstripped and including empty ones.
+    """
+    spans = []
+    # Default "dict" flags: dropping image blocks would change how MuPDF
+    # splits the surrounding text into blocks, so they are skipped below
+    blocks = page.get_text("dict")['blocks']
+    for block_no, block in enumerate(blocks):
+        if block['type'] != 0:
+            continue
+        for line_no, line in enumerate(block['lines']):
+            for span in line['spans']:
+                font = span['font']
+                x0, y0, x1, y1 = span['bbox']
+                spans.append(Span(span['text'], span['size'], font, is_bold_font(font),
+                                  page_num, block_no, line_no, x0, y0, x1, y1))
+    return spans
+
+
+def iter_page_spans(doc, page_numbers=None):
+    """
+    Yields (page number, spans) one page at a time; page numbers are
+    1-based. Only one page's records are alive at a time unless the caller
+    keeps them.
+    """
+    if page_numbers is None:
+        page_numbers = range(1, len(doc) + 1)
+    for page_num in page_numbers:
+        with metrics.stage('parse'):
+            spans = page_spans(doc[page_num - 1], page_num)
+        metrics.count('pages')
+        metrics.count('spans', len(spans))
+        yield page_num, spans
+
+
+def group_lines(spans):
+    """
+    Splits a page's spans into lines (lists of spans).
+    """
+    lines = []
+    key = None
+    for span in spans:
+        if (span.block, span.line) != key:
+            key = (span.block, span.line)
+            lines.append([])
+        lines[-1].append(span)
+    return lines
+
+
+def group_blocks(spans):
+    """
+    Splits a page's spans into blocks, each a list of lines.
+    """
+    blocks = []
+    block_no = None
+    for line in group_lines(spans):
+        if line[0].block != block_no:
+            block_no = line[0].block
+            blocks.append([])
+        blocks[-1].append(line)
+    return blocks
+
+
+def page_ranges(page_count, parts):
+    """
+    Splits pages 1..page_count into up to `parts` contiguous ranges of
+    near-equal size, as a list of range objects of 1-based page numbers.
+    """
+    parts = max(1, min(parts, page_count))
+    bounds = [1 + page_count * i // parts for i in range(parts + 1)]
+    return [range(bounds[i], bounds[i + 1]) for i in range(parts)]
+
+
+def map_page_ranges(pdf_path, func, workers, min_pages=PARALLEL_MIN_PAGES):
+    """
+    Splits pdf_path into `workers` page ranges, runs func(pdf_path,
+    page_numbers) for each in its own process (every worker opens the file
+    itself) and returns the results in page order. `func` must be a
+    top-level function. Runs a single in-process call over all pages when
+    workers <= 1 or the document is shorter than min_pages. If the wait is
+    interrupted (e.g. by a per-file timeout), the workers are terminated.
+    """
+    with fitz.open(pdf_path) as doc:
+        page_count = len(doc)
+    if workers <= 1 or page_count < min_pages:
+        return [func(pdf_path, range(1, page_count + 1))]
+    ranges = page_ranges(page_count, workers)
+    # Leaving the block terminates the pool, so no worker outlives the call
+    with multiprocessing.Pool(len(ranges)) as pool:
+        if not metrics.enabled():
+            return pool.starmap(func, [(pdf_path, pages) for pages in ranges])
+        results = []
+        for result, snap in pool.starmap(metrics.measured, [(func, pdf_path, pages) for pages in ranges]):
+            metrics.merge(snap)
+            results.append(result)
+        return results
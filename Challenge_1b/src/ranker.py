@@ -1,116 +1,352 @@
+import os
+import re
+import json
+import hashlib
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from collections import defaultdict
-from sentence_transformers import CrossEncoder
-def rank_sections(sections, section_vectors, query_vector, top_k=5):
+import metrics
+from inference_backend import load_cross_encoder, model_key
+from embedder import count_encoded
+from vector_index import top_k as top_k_indices, normalize_rows
+from section_corpus import SectionCorpus
+
+# Hybrid score weights
+DEFAULT_WEIGHTS = {
+    "similarity": 0.65,  # Core semantic similarity
+    "length": 0.25,      # Prefer richer sections
+    "position": 0.10,    # Slight preference to early pages
+    "lexical": 0.15,     # BM25 match, only with the lexical prefilter
+}
+
+def section_columns(sections):
+    """
+    Text lengths and page numbers of all sections as arrays.
+    """
+    if isinstance(sections, SectionCorpus):
+        return sections.text_lengths.astype(np.float64), sections.pages.astype(np.float64)
+    n = len(sections)
+    text_lengths = np.fromiter((len(sec["full_text"]) for sec in sections), dtype=np.float64, count=n)
+    pages = np.fromiter((sec["page"] for sec in sections), dtype=np.float64, count=n)
+    return text_lengths, pages
+
+def hybrid_scores(similarities, text_lengths, pages, weights=None, lexical=None):
+    """
+    Weighted hybrid score for every section at once. `lexical` holds BM25
+    scores scaled to [0, 1] when the lexical prefilter is used.
+    """
+    w = DEFAULT_WEIGHTS if weights is None else {**DEFAULT_WEIGHTS, **weights}
+    length_score = np.minimum(text_lengths / 500, 1.0)  # Cap at 1.0
+    position_score = np.maximum(1.0 - (pages - 1) * 0.1, 0)  # Earlier pages weigh more
+    scores = (
+        w["similarity"] * np.asarray(similarities, dtype=np.float64) +
+        w["length"] * length_score +
+        w["position"] * position_score
+    )
+    if lexical is not None:
+        scores += w["lexical"] * np.asarray(lexical, dtype=np.float64)
+    return scores
+
+def rank_sections(sections, section_vectors, query_vector, top_k=5, index=None, candidates=100,
+                  weights=None, similarities=None, lexical=None):
     """
     Rank sections using a hybrid scoring mechanism.
+    If a vector index (see vector_index.py) built over section_vectors is
+    given, only its `candidates` nearest sections are scored. Precomputed
+    query-section similarities can be passed instead of the vectors, and
+    per-section lexical scores are fused into the hybrid score.
+    `sections` may be a list of dicts or a SectionCorpus; only the returned
+    sections are built as dicts, with their position in `sections` as "row".
     """
-    similarities = cosine_similarity([query_vector], section_vectors)[0]
-    
+    with metrics.stage("similarity"):
+        text_lengths, pages = section_columns(sections)
+        if index is not None:
+            candidate_ids, candidate_sims = index.search(query_vector, max(candidates, top_k))
+            # Score candidates in document order so ties break as in a full scan
+            order = np.argsort(candidate_ids, kind="stable")
+            candidate_ids, similarities = candidate_ids[order], candidate_sims[order]
+            text_lengths, pages = text_lengths[candidate_ids], pages[candidate_ids]
+            if lexical is not None:
+                lexical = np.asarray(lexical)[candidate_ids]
+        else:
+            candidate_ids = np.arange(len(sections))
+            if similarities is None:
+                similarities = normalize_rows(section_vectors) @ normalize_rows(query_vector)
+
+        scores = hybrid_scores(similarities, text_lengths, pages, weights, lexical)
+        best = top_k_indices(scores, top_k)
+
+    # Only the returned sections are materialised as dicts
     ranked = []
-    for i, section in enumerate(sections):
-        similarity_score = similarities[i]
-        
-        # Heuristics
-        length_score = min(len(section["full_text"]) / 500, 1.0)  # Cap at 1.0
-        position_score = max(1.0 - (section["page"] - 1) * 0.1, 0)  # Earlier pages weigh more
-        
-        # Weighted hybrid score
-        final_score = (
-            0.65 * similarity_score +    # Core semantic similarity
-            0.25 * length_score +        # Prefer richer sections
-            0.10 * position_score        # Slight preference to early pages
-        )
-
-        section_copy = section.copy()
-        section_copy["score"] = final_score
-        section_copy["similarity_score"] = float(similarity_score)
-        section_copy["importance_rank"] = 0  # temporary
+    for rank, i in enumerate(best, 1):
+        section_copy = sections[candidate_ids[i]].copy()
+        section_copy["row"] = int(candidate_ids[i])
+        section_copy["score"] = float(scores[i])
+        section_copy["similarity_score"] = float(similarities[i])
+        section_copy["importance_rank"] = rank
         ranked.append(section_copy)
+    return ranked
 
-    # Sort by final_score
-    ranked_sorted = sorted(ranked, key=lambda x: x["score"], reverse=True)
 
-    # Assign final ranks
-    for i, sec in enumerate(ranked_sorted[:top_k]):
-        sec["importance_rank"] = i + 1
 
-    return ranked_sorted[:top_k]
+# Sentence ends followed by something that starts a new sentence or bullet
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+(?=["\'(\u201c\u2018\u2022A-Z0-9])|\s+(?=\u2022)')
 
+def split_chunks(text, max_chars=500, min_chars=20):
+    """
+    Split text into paragraphs (blank-line or newline separated), then pack
+    consecutive sentences of each paragraph into chunks of at most
+    max_chars. A paragraph that already fits is kept whole.
+    """
+    chunks = []
+    for paragraph in re.split(r'\n\s*', text):
+        paragraph = paragraph.strip()
+        if len(paragraph) <= max_chars:
+            if len(paragraph) > min_chars:
+                chunks.append(paragraph)
+            continue
+        current = ""
+        for sentence in SENTENCE_BOUNDARY.split(paragraph):
+            sentence = sentence.strip()
+            if not sentence:
+                continue
+            if current and len(current) + 1 + len(sentence) > max_chars:
+                if len(current) > min_chars:
+                    chunks.append(current)
+                current = sentence
+            else:
+                current = f"{current} {sentence}" if current else sentence
+        if len(current) > min_chars:
+            chunks.append(current)
+    return chunks
+
+def extract_subsections_batch(sections, query_vector, model, max_subs=2, known_vectors=None,
+                              batch_size=32, max_chars=500):
+    """
+    Split every section into chunks and rank them against the query with a
+    single encode call. Identical chunks are embedded once, chunks found in
+    known_vectors (text -> normalized vector, e.g. the section embeddings)
+    are not re-embedded, and the rest are encoded longest-first so each
+    micro-batch holds texts of similar length.
+    """
+    known_vectors = known_vectors or {}
+    section_chunks = [split_chunks(sec["full_text"], max_chars=max_chars) for sec in sections]
 
+    unique = {}
+    for chunks in section_chunks:
+        for chunk in chunks:
+            unique.setdefault(chunk, len(unique))
+    if not unique:
+        return []
+
+    texts = list(unique)
+    vectors = np.zeros((len(texts), len(query_vector)), dtype=np.float32)
+    to_encode = [i for i, text in enumerate(texts) if text not in known_vectors]
+    for i, text in enumerate(texts):
+        if text in known_vectors:
+            vectors[i] = known_vectors[text]
+    if to_encode:
+        to_encode.sort(key=lambda i: len(texts[i]), reverse=True)
+        count_encoded(model, [texts[i] for i in to_encode])
+        with metrics.stage("encode"):
+            vectors[to_encode] = model.encode([texts[i] for i in to_encode], batch_size=batch_size,
+                                              convert_to_numpy=True, normalize_embeddings=True)
+
+    # Compute similarity to the query
+    scores = vectors @ (query_vector / (np.linalg.norm(query_vector) or 1.0))
+
+    subsections = []
+    for sec, chunks in zip(sections, section_chunks):
+        # Rank top max_subs
+        ranked_chunks = sorted(chunks, key=lambda c: scores[unique[c]], reverse=True)[:max_subs]
+        for chunk in ranked_chunks:
+            subsections.append({
+                "document": sec["document"],
+                "page_number": sec["page"],
+                "refined_text": chunk
+            })
+    return subsections
 
 def extract_subsections(section, query_vector, model, max_subs=2):
     """
     Further split a section into sentences/paragraphs and rank them.
     """
-    from sentence_transformers import util
+    return extract_subsections_batch([section], query_vector, model, max_subs=max_subs)
 
-    text = section["full_text"]
-    doc_name = section["document"]
-    page = section["page"]
 
-    # Split by paragraph or sentence
-    chunks = [p.strip() for p in text.split('\n') if len(p.strip()) > 20]
+def mmr_select(relevance, vectors, k, diversity=0.3, groups=None, max_per_group=None):
+    """
+    Maximal marginal relevance: picks k rows, each maximising
+    (1 - diversity) * relevance - diversity * (highest cosine similarity
+    to a row already picked). The similarity to the picked set is updated
+    with one matrix-vector product per pick, so the cost is O(k * N).
+    With `groups`, at most max_per_group rows are picked from each group.
+    Returns the picked row indices in pick order.
+    """
+    relevance = np.asarray(relevance, dtype=np.float64)
+    vectors = normalize_rows(vectors)
+    n = len(relevance)
+    available = np.ones(n, dtype=bool)
+    closest = np.full(n, -np.inf)
+    capped = groups is not None and max_per_group
+    if capped:
+        _, group_ids = np.unique(np.asarray(groups), return_inverse=True)
+        group_counts = np.zeros(group_ids.max() + 1, dtype=np.int64)
+    picked = []
+    while len(picked) < k and available.any():
+        redundancy = np.where(np.isfinite(closest), closest, 0.0)
+        gain = (1 - diversity) * relevance - diversity * redundancy
+        gain[~available] = -np.inf
+        best = int(np.argmax(gain))
+        picked.append(best)
+        available[best] = False
+        if capped:
+            group = group_ids[best]
+            group_counts[group] += 1
+            if group_counts[group] >= max_per_group:
+                available &= group_ids != group
+        closest = np.maximum(closest, vectors @ vectors[best])
+    return picked
 
-    if not chunks:
+def diversify_sections(ranked_sections, section_vectors, top_n=5, max_per_doc=2, diversity=0.3):
+    """
+    Re-selects top_n of ranked_sections (with their embeddings as rows of
+    section_vectors) by maximal marginal relevance on their hybrid scores,
+    keeping at most max_per_doc sections from any one PDF, so the result
+    is not dominated by near-duplicate blocks of one document.
+    """
+    if not ranked_sections:
         return []
+    groups = [sec["document"] for sec in ranked_sections]
+    picked = mmr_select([sec["score"] for sec in ranked_sections], section_vectors, top_n,
+                        diversity=diversity, groups=groups, max_per_group=max_per_doc)
+    diversified = []
+    for rank, i in enumerate(picked, 1):
+        sec = ranked_sections[i]
+        sec["importance_rank"] = rank
+        diversified.append(sec)
+    return diversified
 
-    # Embed all chunks
-    chunk_embeddings = model.encode(chunks, convert_to_numpy=True, normalize_embeddings=True)
+CROSS_ENCODER_NAME = "cross-encoder/ms-marco-MiniLM-L-12-v2"
+_cross_encoder = None
 
-    # Compute similarity to the query
-    scores = cosine_similarity([query_vector], chunk_embeddings)[0]
+def get_cross_encoder():
+    """
+    Loads the cross-encoder on first use (with the configured inference
+    backend) and keeps it for later calls.
+    """
+    global _cross_encoder
+    if _cross_encoder is None:
+        with metrics.stage("cross_encoder_load"):
+            _cross_encoder = load_cross_encoder(CROSS_ENCODER_NAME)
+    return _cross_encoder
+
+class CrossScoreCache:
+    """
+    (query hash, section hash) -> cross-encoder score, kept in memory and
+    optionally persisted as JSON. Least recently used entries are dropped
+    beyond max_entries.
+    """
 
-    # Rank top max_subs
-    ranked_chunks = sorted(zip(chunks, scores), key=lambda x: x[1], reverse=True)[:max_subs]
+    def __init__(self, path=None, max_entries=100000):
+        self.path = path
+        self.max_entries = max_entries
+        self.scores = {}
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.scores = json.load(f)
 
-    # Format output
-    subsections = []
-    for chunk, _ in ranked_chunks:
-        subsections.append({
-            "document": doc_name,
-            "page_number": page,
-            "refined_text": chunk
-        })
+    @staticmethod
+    def key(query, passage):
+        query_hash = hashlib.sha1(query.encode("utf-8")).hexdigest()
+        passage_hash = hashlib.sha1(f"{model_key(CROSS_ENCODER_NAME)}\0{passage}".encode("utf-8")).hexdigest()
+        return f"{query_hash}:{passage_hash}"
 
-    return subsections
+    def get(self, key):
+        score = self.scores.pop(key, None)
+        if score is not None:
+            self.scores[key] = score
+        return score
 
+    def put(self, key, score):
+        self.scores[key] = score
+        while len(self.scores) > self.max_entries:
+            del self.scores[next(iter(self.scores))]
 
-def diversify_sections(ranked_sections, top_n=5, max_per_doc=2):
-    doc_buckets = defaultdict(list)
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.scores, f)
+        os.replace(tmp_path, self.path)
 
-    # Group by document
-    for section in ranked_sections:
-        doc_buckets[section["document"]].append(section)
+def best_window(text, query, window_words):
+    """
+    The window_words-long stretch of text sharing the most words with the
+    query, so long sections are scored on their relevant part rather than
+    cut at the model's maximum length.
+    """
+    words = text.split()
+    if len(words) <= window_words:
+        return text
+    query_terms = {w.lower().strip(".,;:!?()") for w in query.split()}
+    hits = np.array([w.lower().strip(".,;:!?()") in query_terms for w in words], dtype=np.int32)
+    window_hits = np.convolve(hits, np.ones(window_words, dtype=np.int32), mode="valid")
+    stride = max(1, window_words // 2)
+    start = int(np.argmax(window_hits[::stride])) * stride
+    return " ".join(words[start:start + window_words])
 
-    # Sort each document's sections by importance
-    for doc in doc_buckets:
-        doc_buckets[doc] = sorted(doc_buckets[doc], key=lambda x: x["score"], reverse=True)
+def re_rank_with_cross_encoder(top_sections, query, max_rerank=5, depth=None, cutoff=None,
+                               margin=None, window_words=None, cache=None, blend=0.5):
+    """
+    Blend cross-encoder scores into the hybrid scores of top_sections
+    (sorted best first) and return the best max_rerank.
 
-    # Interleave best from each doc (up to max_per_doc)
-    diversified = []
-    while len(diversified) < top_n:
-        for doc, sections in doc_buckets.items():
-            if sections:
-                diversified.append(sections.pop(0))
-            if len(diversified) >= top_n:
-                break
+    The cascade is tunable: only the first `depth` candidates are
+    considered; candidates trailing the max_rerank-th score by more than
+    `cutoff` are dropped unscored; if every gap between the leading
+    max_rerank + 1 scores is at least `margin` the bi-encoder order is kept
+    and the cross-encoder is skipped; `window_words` scores long sections
+    on their most query-relevant window; `cache` (a CrossScoreCache) reuses
+    scores of (query, section) pairs seen before.
 
-    return diversified
+    Cross scores are the model's raw logits and are unbounded, so cutoff
+    and margin are heuristics. A dropped candidate could only have reached
+    the result if its cross score beat a kept one's by more than
+    cutoff / blend, so no finite cutoff is guaranteed lossless.
+    """
+    candidates = top_sections[:max(depth, max_rerank)] if depth else top_sections
+    bi_scores = [sec["score"] for sec in candidates]
+
+    if cutoff is not None and len(candidates) > max_rerank:
+        floor = sorted(bi_scores, reverse=True)[max_rerank - 1] - cutoff
+        candidates = [sec for sec in candidates if sec["score"] >= floor]
 
-def re_rank_with_cross_encoder(top_sections, query, max_rerank=5):
-    model = CrossEncoder("cross-encoder/ms-marco-MiniLM-L-12-v2")
+    leading = sorted(bi_scores, reverse=True)[:max_rerank + 1]
+    decisive = margin is not None and all(a - b >= margin for a, b in zip(leading, leading[1:]))
 
-    pairs = [(query, sec["full_text"]) for sec in top_sections]
-    scores = model.predict(pairs)
+    if not decisive and candidates:
+        passages = [best_window(sec["full_text"], query, window_words) if window_words else sec["full_text"]
+                    for sec in candidates]
+        keys = [CrossScoreCache.key(query, p) for p in passages] if cache is not None else None
+        scores = [cache.get(k) for k in keys] if cache is not None else [None] * len(candidates)
+        missing = [i for i, score in enumerate(scores) if score is None]
+        metrics.count("cross_pairs_cached", len(candidates) - len(missing))
+        if missing:
+            model = get_cross_encoder()
+            metrics.count("cross_pairs_scored", len(missing))
+            with metrics.stage("cross_encode"):
+                predicted = model.predict([(query, passages[i]) for i in missing])
+            for i, score in zip(missing, predicted):
+                scores[i] = float(score)
+                if cache is not None:
+                    cache.put(keys[i], scores[i])
 
-    for i, score in enumerate(scores):
-        top_sections[i]["score"] += 0.5 * float(score)  # Blend cross-score
+        for sec, score in zip(candidates, scores):
+            sec["score"] += blend * score  # Blend cross-score
 
-    reranked = sorted(top_sections, key=lambda x: x["score"], reverse=True)
+    reranked = sorted(candidates, key=lambda x: x["score"], reverse=True)
     
     for i, sec in enumerate(reranked[:max_rerank]):
         sec["importance_rank"] = i + 1
 
-    return reranked[:max_rerank]
\ No newline at end of file
+    return reranked[:max_rerank]
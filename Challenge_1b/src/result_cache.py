@@ -0,0 +1,163 @@
+import os
+import sys
+import json
+import hashlib
+import argparse
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+
+
+def file_digest(path):
+    """
+    SHA-256 of the file contents, read in chunks.
+    """
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def fingerprint(version, *source_files):
+    """
+    Identifies the extractor that produced a cached result: an explicit
+    version string plus the source of the modules involved, so editing the
+    extraction code invalidates old entries automatically.
+    """
+    h = hashlib.sha256(version.encode('utf-8'))
+    for path in source_files:
+        with open(path, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()[:16]
+
+
+class ResultCache:
+    """
+    On-disk cache of extraction results keyed by PDF content hash and
+    extractor fingerprint. Each entry is one JSON file named
+    <content hash>-<fingerprint>.json; reads refresh the file's mtime so
+    eviction can drop the least recently used entries once the directory
+    grows past max_bytes. Eviction is left to the caller (typically once at
+    the end of a run) so writes stay O(1).
+    """
+
+    def __init__(self, cache_dir, fingerprint, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.fingerprint = fingerprint
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry_path(self, digest):
+        return os.path.join(self.cache_dir, f"{digest}-{self.fingerprint}.json")
+
+    def get(self, digest):
+        path = self._entry_path(digest)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        os.utime(path)
+        return value
+
+    def put(self, digest, value):
+        path = self._entry_path(digest)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(value, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def get_or_compute(self, pdf_path, compute):
+        """
+        Returns the cached result for pdf_path, or runs compute(pdf_path)
+        and stores it.
+        """
+        digest = file_digest(pdf_path)
+        value = self.get(digest)
+        if value is None:
+            value = compute(pdf_path)
+            self.put(digest, value)
+        return value
+
+    def evict(self):
+        evict(self.cache_dir, self.max_bytes)
+
+
+def _entries(cache_dir):
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith('.json'):
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+    return entries
+
+
+def evict(cache_dir, max_bytes):
+    """
+    Deletes least recently used entries until the cache fits in max_bytes.
+    Returns the number of entries removed.
+    """
+    entries = sorted(_entries(cache_dir))
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    return removed
+
+
+def invalidate(cache_dir, pdf_paths=None):
+    """
+    Removes the entries for the given PDFs (any extractor version), or
+    every entry if no paths are given. Returns the number removed.
+    """
+    digests = None
+    if pdf_paths:
+        digests = {file_digest(p) for p in pdf_paths}
+    removed = 0
+    for _, _, path in _entries(cache_dir):
+        if digests is not None and os.path.basename(path).split('-')[0] not in digests:
+            continue
+        os.remove(path)
+        removed += 1
+    return removed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the extraction result cache.")
+    parser.add_argument('cache_dir')
+    sub = parser.add_subparsers(dest='command', required=True)
+    inv = sub.add_parser('invalidate', help="drop entries for the given PDFs, or all entries")
+    inv.add_argument('pdfs', nargs='*')
+    ev = sub.add_parser('evict', help="trim the cache to a size limit")
+    ev.add_argument('--max-mb', type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024))
+    sub.add_parser('stats', help="print entry count and total size")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.cache_dir):
+        print(f"No cache at {args.cache_dir}", file=sys.stderr)
+        return
+    if args.command == 'invalidate':
+        print(f"Removed {invalidate(args.cache_dir, args.pdfs)} entries")
+    elif args.command == 'evict':
+        print(f"Removed {evict(args.cache_dir, args.max_mb * 1024 * 1024)} entries")
+    else:
+        entries = _entries(args.cache_dir)
+        total = sum(size for _, size, _ in entries)
+        print(f"{len(entries)} entries, {total / (1024 * 1024):.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
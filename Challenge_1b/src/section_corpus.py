@@ -0,0 +1,222 @@
+"""
+Columnar storage for extracted sections.
+
+Instead of one dict per section, a SectionCorpus keeps titles and texts
+as UTF-8 string arenas with offset arrays, plus integer document, page
+and text-length columns. Saved corpora are opened with mmap, so loading a
+pre-extracted collection costs almost nothing and section text is only
+decoded when it is read. Indexing a corpus returns the same dict that
+extract_all_sections produces, so code that takes a list of sections
+accepts a corpus too; ranking reads the columns directly.
+
+Layout of a saved corpus directory:
+
+    meta.json          documents, section count, PDF hashes, generation
+    doc_ids.G.npy        int32, index into documents
+    pages.G.npy          int32
+    text_lengths.G.npy   int32, length of full_text in characters
+    title_offsets.G.npy  int64, n + 1 offsets into titles.G.bin
+    text_offsets.G.npy   int64, n + 1 offsets into texts.G.bin
+    titles.G.bin, texts.G.bin
+
+G is the generation named in meta.json. Each save writes a new
+generation and then swaps meta.json, so processes that have the previous
+files mapped keep reading them intact.
+"""
+import os
+import sys
+import json
+import mmap
+import time
+import argparse
+import numpy as np
+from result_cache import file_digest
+
+COLUMNS = ("doc_ids", "pages", "text_lengths", "title_offsets", "text_offsets")
+ARENAS = ("titles", "texts")
+
+
+def _arena(strings):
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in encoded])
+    return b"".join(encoded), offsets
+
+
+def _path(corpus_dir, name, generation):
+    ext = ".bin" if name in ARENAS else ".npy"
+    # Corpora saved before generations existed use plain names
+    return os.path.join(corpus_dir, f"{name}.{generation}{ext}" if generation else name + ext)
+
+
+def _generation(corpus_dir):
+    try:
+        with open(os.path.join(corpus_dir, "meta.json"), encoding="utf-8") as f:
+            return json.load(f).get("generation") or ""
+    except FileNotFoundError:
+        return None
+
+
+def _remove_older(corpus_dir, generation):
+    # Unlinking leaves the files readable to processes that mapped them
+    for name in os.listdir(corpus_dir):
+        parts = name.split(".")
+        if parts[0] in COLUMNS + ARENAS and (len(parts) == 2 or (len(parts) == 3 and parts[1] < generation)):
+            try:
+                os.remove(os.path.join(corpus_dir, name))
+            except OSError:
+                pass  # still mapped on Windows; removed by a later save
+
+
+def _map(path):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class SectionCorpus:
+    def __init__(self, documents, doc_ids, pages, text_lengths, titles, title_offsets, texts, text_offsets,
+                 sources=None):
+        self.documents = documents
+        self.doc_ids = doc_ids
+        self.pages = pages
+        self.text_lengths = text_lengths
+        self.titles = titles
+        self.title_offsets = title_offsets
+        self.texts = texts
+        self.text_offsets = text_offsets
+        self.sources = sources or {}
+
+    @classmethod
+    def from_sections(cls, sections, sources=None):
+        documents = list(dict.fromkeys(sec["document"] for sec in sections))
+        doc_index = {name: i for i, name in enumerate(documents)}
+        n = len(sections)
+        doc_ids = np.fromiter((doc_index[sec["document"]] for sec in sections), dtype=np.int32, count=n)
+        pages = np.fromiter((sec["page"] for sec in sections), dtype=np.int32, count=n)
+        text_lengths = np.fromiter((len(sec["full_text"]) for sec in sections), dtype=np.int32, count=n)
+        titles, title_offsets = _arena(sec["section_title"] for sec in sections)
+        texts, text_offsets = _arena(sec["full_text"] for sec in sections)
+        return cls(documents, doc_ids, pages, text_lengths, titles, title_offsets, texts, text_offsets, sources)
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def full_text(self, i):
+        return bytes(self.texts[self.text_offsets[i]:self.text_offsets[i + 1]]).decode("utf-8")
+
+    def section_title(self, i):
+        return bytes(self.titles[self.title_offsets[i]:self.title_offsets[i + 1]]).decode("utf-8")
+
+    def document(self, i):
+        return self.documents[self.doc_ids[i]]
+
+    def __getitem__(self, i):
+        return {
+            "document": self.document(i),
+            "page": int(self.pages[i]),
+            "section_title": self.section_title(i),
+            "full_text": self.full_text(i),
+        }
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def all_texts(self):
+        return [self.full_text(i) for i in range(len(self))]
+
+    def save(self, corpus_dir):
+        os.makedirs(corpus_dir, exist_ok=True)
+        # Sortable by time, so older generations can be told apart
+        generation = f"{time.time_ns():016x}{os.getpid():06x}"
+        for name in COLUMNS:
+            with open(_path(corpus_dir, name, generation), "wb") as f:
+                np.save(f, getattr(self, name))
+        for name in ARENAS:
+            with open(_path(corpus_dir, name, generation), "wb") as f:
+                f.write(getattr(self, name))
+        current = _generation(corpus_dir)
+        if current and current > generation:
+            # A concurrent save finished with newer data; keep that one
+            _remove_older(corpus_dir, current)
+            return
+        # meta.json last: files it does not name are incomplete or stale
+        tmp_path = os.path.join(corpus_dir, f"meta.json.{generation}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"documents": self.documents, "count": len(self), "sources": self.sources,
+                       "generation": generation}, f, indent=2)
+        os.replace(tmp_path, os.path.join(corpus_dir, "meta.json"))
+        _remove_older(corpus_dir, generation)
+
+    @classmethod
+    def load(cls, corpus_dir, retries=2):
+        with open(os.path.join(corpus_dir, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        generation = meta.get("generation")
+        try:
+            columns = {name: np.load(_path(corpus_dir, name, generation), mmap_mode="r") for name in COLUMNS}
+            titles, texts = (_map(_path(corpus_dir, name, generation)) for name in ARENAS)
+        except FileNotFoundError:
+            if not retries:
+                raise
+            # A newer save replaced this generation after meta.json was read
+            return cls.load(corpus_dir, retries - 1)
+        return cls(meta["documents"], columns["doc_ids"], columns["pages"], columns["text_lengths"],
+                   titles, columns["title_offsets"], texts, columns["text_offsets"],
+                   sources=meta.get("sources"))
+
+
+def section_texts(sections):
+    if isinstance(sections, SectionCorpus):
+        return sections.all_texts()
+    return [sec["full_text"] for sec in sections]
+
+
+def pdf_sources(pdf_folder, filenames):
+    """
+    Content hashes of the PDFs a corpus is built from, to tell whether a
+    saved corpus is still current.
+    """
+    return {
+        name: file_digest(os.path.join(pdf_folder, name))
+        for name in filenames if os.path.exists(os.path.join(pdf_folder, name))
+    }
+
+
+def load_or_extract(corpus_dir, pdf_folder, filenames, extract):
+    """
+    Returns the corpus saved in corpus_dir if it was built from exactly
+    these PDFs, otherwise runs extract(pdf_folder, filenames) (returning
+    section dicts), saves the result there and returns it reloaded.
+    """
+    sources = pdf_sources(pdf_folder, filenames)
+    if os.path.exists(os.path.join(corpus_dir, "meta.json")):
+        corpus = SectionCorpus.load(corpus_dir)
+        if corpus.sources == sources:
+            return corpus
+        del corpus  # release the mappings before the files are rewritten
+    SectionCorpus.from_sections(extract(pdf_folder, filenames), sources).save(corpus_dir)
+    return SectionCorpus.load(corpus_dir)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or inspect a columnar section corpus.")
+    parser.add_argument("corpus_dir")
+    parser.add_argument("--build", nargs=2, metavar=("INPUT_JSON", "PDF_FOLDER"),
+                        help="extract the input's PDFs into corpus_dir")
+    args = parser.parse_args(argv)
+
+    if args.build:
+        from extract_sections import extract_all_sections
+        with open(args.build[0], encoding="utf-8") as f:
+            filenames = [doc["filename"] for doc in json.load(f)["documents"]]
+        load_or_extract(args.corpus_dir, args.build[1], filenames, extract_all_sections)
+    corpus = SectionCorpus.load(args.corpus_dir)
+    size = sum(os.path.getsize(os.path.join(args.corpus_dir, name)) for name in os.listdir(args.corpus_dir))
+    print(f"{len(corpus)} sections from {len(corpus.documents)} documents, {size / 1024:.0f} KiB on disk",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
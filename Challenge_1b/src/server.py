@@ -0,0 +1,120 @@
+import json
+import os
+import sys
+import time
+import argparse
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+import embedder
+from embedder import MODEL_NAME
+from embedding_store import EmbeddingStore
+from extract_sections import open_cache
+from inference_backend import add_backend_args, configure_backend, model_key
+from main import run_pipeline, rerank_options
+from ranker import get_cross_encoder, CrossScoreCache
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """
+    POST / with {"input": <challenge1b_input.json contents>, "pdf_folder": "..."}
+    (or "input_json": <path> instead of "input") returns the same JSON that
+    main.py writes. Per-stage latency is reported in the Server-Timing
+    header and logged to stderr.
+    """
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send(200, {"status": "ok", "model": MODEL_NAME})
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        start = time.perf_counter()
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(request, dict):
+                raise ValueError("expected a JSON object")
+            input_data = request.get("input")
+            if input_data is None:
+                with open(request["input_json"], "r", encoding="utf-8") as f:
+                    input_data = json.load(f)
+            pdf_folder = request["pdf_folder"]
+        except (KeyError, TypeError, ValueError, OSError) as e:
+            self._send(400, {"error": f"bad request: {e}"})
+            return
+
+        timings = {}
+        try:
+            output = run_pipeline(input_data, pdf_folder, cache=self.server.cache,
+                                  store=self.server.store, timings=timings,
+                                  index_kind=self.server.index_kind, candidates=self.server.candidates,
+                                  indexes=self.server.indexes,
+                                  rerank=self.server.rerank, cross_cache=self.server.cross_cache)
+        except Exception as e:
+            self._send(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        if self.server.cache is not None:
+            self.server.cache.evict()
+        timings["total"] = time.perf_counter() - start
+        self._send(200, output, timings)
+        self.log_message("%s", " ".join(f"{k}={v * 1000:.1f}ms" for k, v in timings.items()))
+
+    def _send(self, status, body, timings=None):
+        payload = json.dumps(body, indent=2).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        if timings:
+            self.send_header("Server-Timing", ", ".join(
+                f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items()))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve ranking requests with the models kept in memory.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--cache-dir", default=os.environ.get("SECTION_CACHE_DIR"))
+    parser.add_argument("--embedding-store", default=os.environ.get("EMBEDDING_STORE_DIR"))
+    parser.add_argument("--index", choices=["exact", "ivf"], default=None,
+                        help="retrieve ranking candidates through a vector index, built once per collection")
+    parser.add_argument("--candidates", type=int, default=100)
+    parser.add_argument("--rerank-depth", type=int, default=None)
+    parser.add_argument("--rerank-cutoff", type=float, default=None)
+    parser.add_argument("--rerank-margin", type=float, default=None)
+    parser.add_argument("--rerank-window", type=int, default=None)
+    parser.add_argument("--cross-cache", default=os.environ.get("CROSS_SCORE_CACHE"),
+                        help="persist cross-encoder scores here on shutdown (always cached in memory)")
+    add_backend_args(parser)
+    args = parser.parse_args(argv)
+    configure_backend(args)
+
+    # Load both models up front so the first request does not pay for it
+    start = time.perf_counter()
+    embedder.get_model()
+    get_cross_encoder()
+    print(f"Models loaded in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+    # Requests are handled one at a time; the models are not shared across threads
+    server = HTTPServer((args.host, args.port), QueryHandler)
+    server.cache = open_cache(args.cache_dir)
+    server.store = EmbeddingStore(args.embedding_store, model_key(MODEL_NAME)) if args.embedding_store else None
+    server.index_kind = args.index
+    server.candidates = args.candidates
+    server.indexes = {}
+    server.rerank = rerank_options(args)
+    server.cross_cache = CrossScoreCache(args.cross_cache)
+    print(f"Listening on http://{args.host}:{args.port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.cross_cache.save()
+
+
+if __name__ == "__main__":
+    main()
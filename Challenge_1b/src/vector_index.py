@@ -0,0 +1,247 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+
+def normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def top_k(scores, k):
+    """
+    Indices of the k largest scores, best first, without sorting everything.
+    Ties are ordered by index, exactly like a stable full sort.
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < len(scores):
+        kth = scores[np.argpartition(-scores, k - 1)[k - 1]]
+        candidates = np.flatnonzero(scores >= kth)
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")][:k]
+
+
+class ExactIndex:
+    """
+    Brute-force cosine search: one matrix-vector product and argpartition.
+    """
+    FIELDS = ("vectors",)
+
+    def __init__(self, vectors):
+        self.vectors = normalize_rows(vectors)
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def search(self, query, k):
+        scores = self.vectors @ normalize_rows(query)
+        ids = top_k(scores, k)
+        return ids, scores[ids]
+
+
+class IVFIndex:
+    """
+    Inverted-file index: vectors are clustered with spherical k-means and
+    stored grouped by cluster, and a query only scans the n_probe clusters
+    whose centroids are closest to it.
+    """
+    FIELDS = ("centroids", "ids", "vectors", "offsets", "n_probe")
+
+    def __init__(self, vectors, n_lists=None, n_probe=8, n_iter=10, seed=0):
+        vectors = normalize_rows(vectors)
+        n = len(vectors)
+        if n_lists is None:
+            n_lists = max(1, int(np.sqrt(n)))
+        n_lists = max(1, min(n_lists, n))
+        self.n_probe = n_probe
+
+        rng = np.random.default_rng(seed)
+        centroids = vectors[rng.choice(n, n_lists, replace=False)] if n else \
+            np.zeros((0, vectors.shape[1]), np.float32)
+        assign = np.zeros(n, dtype=np.int64)
+        for _ in range(n_iter):
+            assign = self._assign(vectors, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, vectors)
+            empty = np.bincount(assign, minlength=n_lists) == 0
+            # Keep the previous centroid for clusters that lost all members
+            sums[empty] = centroids[empty]
+            centroids = normalize_rows(sums)
+        assign = self._assign(vectors, centroids)
+
+        order = np.argsort(assign, kind="stable")
+        self.centroids = centroids
+        self.ids = order
+        self.vectors = vectors[order]
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=n_lists))])
+
+    @staticmethod
+    def _assign(vectors, centroids, chunk=65536):
+        assign = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), chunk):
+            assign[start:start + chunk] = np.argmax(vectors[start:start + chunk] @ centroids.T, axis=1)
+        return assign
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, query, k, n_probe=None):
+        query = normalize_rows(query)
+        probe = top_k(self.centroids @ query, n_probe or self.n_probe)
+        rows = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in probe]) \
+            if len(probe) else np.zeros(0, dtype=np.int64)
+        scores = self.vectors[rows] @ query
+        best = top_k(scores, k)
+        return self.ids[rows[best]], scores[best]
+
+
+INDEX_TYPES = {"exact": ExactIndex, "ivf": IVFIndex}
+
+# Indexes kept in memory by load_or_build, most recently used last
+MAX_LOADED = 4
+# Index files kept in an index_dir; the least recently used go beyond this
+MAX_SAVED = 16
+
+
+def build_index(vectors, kind="exact", **options):
+    return INDEX_TYPES[kind](vectors, **options)
+
+
+def save_index(index, path):
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, **{name: getattr(index, name) for name in index.FIELDS})
+    os.replace(tmp_path, path)
+
+
+def load_index(path, kind):
+    cls = INDEX_TYPES[kind]
+    index = cls.__new__(cls)
+    with np.load(path) as data:
+        for name in cls.FIELDS:
+            setattr(index, name, data[name] if data[name].ndim else data[name].item())
+    return index
+
+
+def evict_saved(index_dir, max_files=MAX_SAVED):
+    """
+    Deletes the least recently used index files beyond max_files.
+    """
+    entries = []
+    for name in os.listdir(index_dir):
+        if name.endswith(".npz") and ".tmp" not in name:
+            try:
+                entries.append((os.stat(os.path.join(index_dir, name)).st_mtime, name))
+            except FileNotFoundError:
+                continue
+    for _, name in sorted(entries, reverse=True)[max_files:]:
+        try:
+            os.remove(os.path.join(index_dir, name))
+        except FileNotFoundError:
+            pass
+
+
+def load_or_build(vectors, kind, key, index_dir=None, loaded=None):
+    """
+    Returns the `kind` index over vectors, built at most once per
+    collection: `key` identifies the vectors (e.g. a digest of the section
+    texts), `loaded` is a dict the caller keeps between queries, and
+    index_dir persists built indexes across runs, keeping the MAX_SAVED
+    most recently used.
+    """
+    if loaded is not None and (kind, key) in loaded:
+        loaded[kind, key] = loaded.pop((kind, key))
+        return loaded[kind, key]
+    path = os.path.join(index_dir, f"{kind}-{key[:32]}.npz") if index_dir else None
+    index = None
+    if path and os.path.exists(path):
+        try:
+            index = load_index(path, kind)
+            os.utime(path)
+        except FileNotFoundError:
+            pass  # evicted by another process in the meantime
+    if index is None:
+        index = build_index(vectors, kind)
+        if path:
+            os.makedirs(index_dir, exist_ok=True)
+            save_index(index, path)
+            evict_saved(index_dir)
+    if loaded is not None:
+        loaded[kind, key] = index
+        while len(loaded) > MAX_LOADED:
+            loaded.pop(next(iter(loaded)))
+    return index
+
+
+def evaluate(index, vectors, queries, k=10):
+    """
+    Recall@k of `index` against exact search, plus per-query latency.
+    """
+    exact = ExactIndex(vectors)
+    hits, latencies = 0, []
+    for query in queries:
+        truth = set(exact.search(query, k)[0].tolist())
+        start = time.perf_counter()
+        ids, _ = index.search(query, k)
+        latencies.append(time.perf_counter() - start)
+        hits += len(truth.intersection(ids.tolist()))
+    latencies = np.array(latencies) * 1000
+    return {
+        "queries": len(queries),
+        "k": k,
+        "recall": hits / max(1, len(queries) * min(k, len(vectors))),
+        "latency_ms_p50": float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+        "latency_ms_p95": float(np.percentile(latencies, 95)) if len(latencies) else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report recall and latency of the vector indexes.")
+    parser.add_argument("--store", help="embedding store directory (see embedding_store.py)")
+    parser.add_argument("--model", default="multi-qa-mpnet-base-dot-v1")
+    parser.add_argument("--synthetic", type=int, default=0, help="use N random vectors instead of a store")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--lists", type=int, default=None)
+    parser.add_argument("--probe", type=int, nargs="+", default=[1, 4, 8, 16])
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    if args.store:
+        from embedding_store import EmbeddingStore
+        vectors = np.asarray(EmbeddingStore(args.store, args.model).matrix())
+    elif args.synthetic:
+        # Clustered like real embeddings rather than uniform on the sphere
+        centers = rng.standard_normal((max(1, args.synthetic // 200), args.dim))
+        vectors = centers[rng.integers(len(centers), size=args.synthetic)]
+        vectors = (vectors + 0.5 * rng.standard_normal(vectors.shape)).astype(np.float32)
+    else:
+        parser.error("pass --store or --synthetic")
+    if not len(vectors):
+        print("No vectors to index", file=sys.stderr)
+        return
+
+    # Perturbed copies of stored rows stand in for real queries
+    picks = rng.choice(len(vectors), min(args.queries, len(vectors)), replace=False)
+    noise = rng.standard_normal((len(picks), vectors.shape[1])) * (0.1 / np.sqrt(vectors.shape[1]))
+    queries = normalize_rows(vectors[picks]) + noise
+
+    print(f"{len(vectors)} vectors, dim {vectors.shape[1]}, k={args.k}")
+    print(f"exact     {evaluate(ExactIndex(vectors), vectors, queries, args.k)}")
+    start = time.perf_counter()
+    ivf = IVFIndex(vectors, n_lists=args.lists)
+    print(f"ivf build {time.perf_counter() - start:.2f}s, {len(ivf.centroids)} lists")
+    for n_probe in args.probe:
+        ivf.n_probe = n_probe
+        print(f"ivf probe={n_probe:<3} {evaluate(ivf, vectors, queries, args.k)}")
+
+
+if __name__ == "__main__":
+    main()
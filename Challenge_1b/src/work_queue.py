@@ -0,0 +1,206 @@
+"""
+SQLite-backed job queue for spreading extraction over several processes
+or machines that share a filesystem; no broker is needed.
+
+Workers claim one job at a time under a lease. A worker that crashes
+simply stops renewing, and once its lease expires the job is handed to
+the next worker that asks (up to max_attempts tries). Jobs belong to
+shards so progress can be followed per shard and workers can be pinned
+to one.
+
+    python work_queue.py QUEUE.sqlite status
+"""
+import os
+import sys
+import json
+import time
+import socket
+import sqlite3
+import argparse
+import threading
+
+DEFAULT_LEASE = 600
+DEFAULT_MAX_ATTEMPTS = 3
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    key TEXT UNIQUE NOT NULL,
+    shard INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,
+    lease_expires REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, shard);
+'''
+
+
+def default_owner():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+class JobQueue:
+    def __init__(self, db_path, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        # Autocommit; claims take the write lock explicitly
+        self.db = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def add(self, jobs, shards=1):
+        """
+        Enqueues (key, payload) pairs, spreading them round-robin over
+        `shards`. Keys already in the queue are skipped, so re-running the
+        coordinator is safe.
+        """
+        rows = [(key, i % shards, json.dumps(payload)) for i, (key, payload) in enumerate(jobs)]
+        self.db.execute('BEGIN IMMEDIATE')
+        self.db.executemany('INSERT OR IGNORE INTO jobs (key, shard, payload) VALUES (?, ?, ?)', rows)
+        self.db.execute('COMMIT')
+
+    def claim(self, owner, lease=DEFAULT_LEASE, shard=None):
+        """
+        Leases the next pending job, or one whose lease has expired, to
+        owner. Returns (job id, key, payload) or None if nothing is
+        claimable right now.
+        """
+        now = time.time()
+        query = ('SELECT id, key, payload FROM jobs WHERE attempts < ? AND '
+                 "(state = 'pending' OR (state = 'leased' AND lease_expires < ?))")
+        params = [self.max_attempts, now]
+        if shard is not None:
+            query += ' AND shard = ?'
+            params.append(shard)
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            row = self.db.execute(query + ' ORDER BY id LIMIT 1', params).fetchone()
+            if row is not None:
+                self.db.execute("UPDATE jobs SET state = 'leased', owner = ?, lease_expires = ?, "
+                                'attempts = attempts + 1 WHERE id = ?', (owner, now + lease, row[0]))
+        finally:
+            self.db.execute('COMMIT')
+        if row is None:
+            return None
+        return row[0], row[1], json.loads(row[2])
+
+    def renew(self, job_id, owner, lease=DEFAULT_LEASE):
+        self.db.execute("UPDATE jobs SET lease_expires = ? WHERE id = ? AND owner = ? AND state = 'leased'",
+                        (time.time() + lease, job_id, owner))
+
+    def complete(self, job_id, owner):
+        # A worker whose lease was taken over no longer owns the job
+        self.db.execute("UPDATE jobs SET state = 'done', lease_expires = NULL, error = NULL "
+                        "WHERE id = ? AND owner = ? AND state = 'leased'", (job_id, owner))
+
+    def fail(self, job_id, owner, error):
+        self.db.execute("UPDATE jobs SET state = CASE WHEN attempts < ? THEN 'pending' ELSE 'failed' END, "
+                        "lease_expires = NULL, error = ? WHERE id = ? AND owner = ? AND state = 'leased'",
+                        (self.max_attempts, error, job_id, owner))
+
+    def progress(self):
+        """
+        Returns {shard: {state: count}}. Leased jobs whose lease expired
+        after max_attempts tries are reported as failed.
+        """
+        rows = self.db.execute(
+            "SELECT shard, CASE WHEN state = 'leased' AND lease_expires < ? AND attempts >= ? "
+            "THEN 'failed' ELSE state END, COUNT(*) FROM jobs GROUP BY 1, 2",
+            (time.time(), self.max_attempts)).fetchall()
+        shards = {}
+        for shard, state, count in rows:
+            shards.setdefault(shard, {})[state] = count
+        return shards
+
+    def unfinished(self, shard=None):
+        """
+        Number of jobs that are pending or leased and may still finish.
+        """
+        totals = [counts for s, counts in self.progress().items() if shard is None or s == shard]
+        return sum(counts.get('pending', 0) + counts.get('leased', 0) for counts in totals)
+
+    def jobs(self, state=None):
+        """
+        Returns [(key, payload, state, error)] in enqueue order.
+        """
+        query = 'SELECT key, payload, state, error FROM jobs'
+        params = ()
+        if state is not None:
+            query += ' WHERE state = ?'
+            params = (state,)
+        return [(key, json.loads(payload), s, error)
+                for key, payload, s, error in self.db.execute(query + ' ORDER BY id', params)]
+
+
+def _heartbeat(db_path, job_id, owner, lease, stop):
+    # Renews the lease while a long job runs; dies with a crashed worker
+    queue = JobQueue(db_path)
+    try:
+        while not stop.wait(lease / 3):
+            queue.renew(job_id, owner, lease)
+    finally:
+        queue.close()
+
+
+def run_worker(db_path, handler, owner=None, lease=DEFAULT_LEASE, shard=None, poll=1.0):
+    """
+    Claims and runs jobs with handler(payload) until no job in the queue
+    (or in `shard`) can still finish. Exceptions mark the job failed so it
+    is retried. Returns the number of jobs this worker completed.
+    """
+    owner = owner or default_owner()
+    queue = JobQueue(db_path)
+    completed = 0
+    try:
+        while True:
+            job = queue.claim(owner, lease, shard)
+            if job is None:
+                if not queue.unfinished(shard):
+                    return completed
+                time.sleep(poll)  # others hold the remaining leases
+                continue
+            job_id, key, payload = job
+            stop = threading.Event()
+            heartbeat = threading.Thread(target=_heartbeat, args=(db_path, job_id, owner, lease, stop), daemon=True)
+            heartbeat.start()
+            try:
+                handler(payload)
+            except Exception as e:
+                print(f"Failed: {key} -> {type(e).__name__}: {e}", file=sys.stderr)
+                queue.fail(job_id, owner, f'{type(e).__name__}: {e}')
+            else:
+                queue.complete(job_id, owner)
+                completed += 1
+            finally:
+                stop.set()
+                heartbeat.join()
+    finally:
+        queue.close()
+
+
+def print_status(queue):
+    for shard, counts in sorted(queue.progress().items()):
+        total = sum(counts.values())
+        states = ', '.join(f'{state}={count}' for state, count in sorted(counts.items()))
+        print(f'shard {shard}: {counts.get("done", 0)}/{total} done ({states})')
+    for key, _, _, error in queue.jobs('failed'):
+        print(f'failed: {key}: {error}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect a work queue.")
+    parser.add_argument('db')
+    parser.add_argument('command', choices=['status'])
+    args = parser.parse_args(argv)
+    queue = JobQueue(args.db)
+    print_status(queue)
+    queue.close()
+
+
+if __name__ == '__main__':
+    main()
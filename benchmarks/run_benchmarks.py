@@ -0,0 +1,308 @@
+"""
+Benchmark and regression harness for both challenges.
+
+Runs the Challenge_1a outline extractor, the Challenge_1b section
+extractor and the full 1b pipeline over the bundled samples and over
+synthetic large PDFs, reporting wall time per stage, pages/sec, peak RSS
+and accuracy against the expected outputs. Each case runs in a fresh
+process so peak RSS is per case. Embedding models are stubbed (see
+stub_models.py), so the suite runs offline and 1b accuracy numbers only
+measure agreement with the expected outputs, not model quality.
+
+    python benchmarks/run_benchmarks.py --output results.json
+    python benchmarks/run_benchmarks.py --compare results.json
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import glob
+import platform
+import argparse
+import resource
+import subprocess
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+CHALLENGE_1A = os.path.join(ROOT, "Challenge_1a")
+CHALLENGE_1B = os.path.join(ROOT, "Challenge_1b")
+CHALLENGE_1B_SRC = os.path.join(CHALLENGE_1B, "src")
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def page_count(pdf_path):
+    import fitz
+    with fitz.open(pdf_path) as doc:
+        return len(doc)
+
+
+def outline_scores(predicted, expected):
+    """
+    Precision/recall of (level, text, page) outline entries, plus whether
+    the title matches.
+    """
+    def key(item):
+        return (item["level"], " ".join(item["text"].split()).lower(), item["page"])
+
+    pred = {key(i) for i in predicted["outline"]}
+    exp = {key(i) for i in expected["outline"]}
+    hits = len(pred & exp)
+    return {
+        "precision": hits / len(pred) if pred else float(not exp),
+        "recall": hits / len(exp) if exp else 1.0,
+        "title_match": predicted["title"].strip() == expected["title"].strip(),
+    }
+
+
+def mean(values):
+    values = list(values)
+    return sum(values) / len(values) if values else 0.0
+
+
+def case_outline(pdf_paths, expected):
+    """
+    Challenge_1a: parse and outline stages for each PDF.
+    """
+    sys.path.insert(0, CHALLENGE_1A)
+    import fitz
+    from process_pdfs import collect_text_blocks, build_outline
+
+    parse_time = outline_time = 0.0
+    pages = 0
+    scores = []
+    for pdf_path in pdf_paths:
+        start = time.perf_counter()
+        with fitz.open(pdf_path) as doc:
+            pages += len(doc)
+            text_blocks = collect_text_blocks(doc)
+        parse_time += time.perf_counter() - start
+        start = time.perf_counter()
+        result = build_outline(text_blocks)
+        outline_time += time.perf_counter() - start
+        if pdf_path in expected:
+            scores.append(outline_scores(result, expected[pdf_path]))
+
+    total = parse_time + outline_time
+    return {
+        "files": len(pdf_paths),
+        "pages": pages,
+        "stages": {"parse": parse_time, "outline": outline_time},
+        "wall_time": total,
+        "pages_per_sec": pages / total if total else 0.0,
+        "precision": mean(s["precision"] for s in scores),
+        "recall": mean(s["recall"] for s in scores),
+        "title_accuracy": mean(s["title_match"] for s in scores),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def case_sections(pdf_paths):
+    """
+    Challenge_1b: section extraction only.
+    """
+    sys.path.insert(0, CHALLENGE_1B_SRC)
+    from extract_sections import extract_sections_from_pdf
+
+    pages = sum(page_count(p) for p in pdf_paths)
+    start = time.perf_counter()
+    sections = [extract_sections_from_pdf(p) for p in pdf_paths]
+    elapsed = time.perf_counter() - start
+    # A speed-up must not change what is extracted; print_report flags a changed digest
+    digest = hashlib.sha256(json.dumps(sections, sort_keys=True).encode("utf-8")).hexdigest()
+    return {
+        "files": len(pdf_paths),
+        "pages": pages,
+        "sections": sum(map(len, sections)),
+        "sections_digest": digest[:16],
+        "stages": {"extract": elapsed},
+        "wall_time": elapsed,
+        "pages_per_sec": pages / elapsed if elapsed else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def case_pipeline(collection_dir, options=None):
+    """
+    Challenge_1b: the full pipeline on one collection with stubbed models.
+    `options` are passed on to run_pipeline.
+    """
+    sys.path.insert(0, BENCH_DIR)
+    sys.path.insert(0, CHALLENGE_1B_SRC)
+    import stub_models
+    stub_models.install()
+    start = time.perf_counter()
+    from main import run_pipeline
+    import extract_sections, embedder, embedding_store, vector_index, ranker  # noqa: F401 (loaded lazily by main)
+    import_time = time.perf_counter() - start
+
+    with open(os.path.join(collection_dir, "challenge1b_input.json"), encoding="utf-8") as f:
+        input_data = json.load(f)
+    pdf_folder = os.path.join(collection_dir, "PDFs")
+    pages = sum(page_count(os.path.join(pdf_folder, d["filename"])) for d in input_data["documents"])
+
+    timings = {}
+    start = time.perf_counter()
+    output = run_pipeline(input_data, pdf_folder, timings=timings, **(options or {}))
+    elapsed = time.perf_counter() - start
+
+    result = {
+        "files": len(input_data["documents"]),
+        "pages": pages,
+        "stages": timings,
+        "import_time": import_time,
+        "wall_time": elapsed,
+        "pages_per_sec": pages / elapsed if elapsed else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    expected_path = os.path.join(collection_dir, "challenge1b_output.json")
+    if os.path.exists(expected_path):
+        with open(expected_path, encoding="utf-8") as f:
+            expected = json.load(f)
+
+        def key(sec):
+            return (sec["document"], sec["page_number"])
+
+        pred = {key(s) for s in output["extracted_sections"]}
+        exp = {key(s) for s in expected["extracted_sections"]}
+        result["section_overlap"] = len(pred & exp) / len(exp) if exp else 1.0
+    return result
+
+
+def case_startup():
+    """
+    Challenge_1b: time to import the CLI and to answer --help in a fresh
+    interpreter, before any stage has loaded its dependencies.
+    """
+    sys.path.insert(0, CHALLENGE_1B_SRC)
+    start = time.perf_counter()
+    import main  # noqa: F401
+    import_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    subprocess.run([sys.executable, os.path.join(CHALLENGE_1B_SRC, "main.py"), "--help"],
+                   check=True, capture_output=True)
+    help_time = time.perf_counter() - start
+    return {
+        "stages": {"import_main": import_time, "help": help_time},
+        "import_time": import_time,
+        "wall_time": help_time,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_case(func, *args):
+    # A fresh interpreter per case keeps peak RSS and imports independent
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+        return pool.submit(func, *args).result()
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_all(synthetic_pages, skip_pipeline=False):
+    cases = {}
+
+    pdf_dir = os.path.join(CHALLENGE_1A, "dataset", "pdfs")
+    out_dir = os.path.join(CHALLENGE_1A, "dataset", "outputs")
+    pdfs = sorted(glob.glob(os.path.join(pdf_dir, "*.pdf")))
+    expected = {}
+    for pdf_path in pdfs:
+        json_path = os.path.join(out_dir, os.path.splitext(os.path.basename(pdf_path))[0] + ".json")
+        if os.path.exists(json_path):
+            with open(json_path, encoding="utf-8") as f:
+                expected[pdf_path] = json.load(f)
+    cases["1a_outline_samples"] = run_case(case_outline, pdfs, expected)
+    cases["1b_sections_samples"] = run_case(case_sections, pdfs)
+
+    cases["1b_startup"] = run_case(case_startup)
+
+    collections = sorted(glob.glob(os.path.join(CHALLENGE_1B, "Collection_*")))
+    for collection in collections:
+        name = os.path.basename(collection).lower()
+        collection_pdfs = sorted(glob.glob(os.path.join(collection, "PDFs", "*.pdf")))
+        cases[f"1b_sections_{name}"] = run_case(case_sections, collection_pdfs)
+        if not skip_pipeline:
+            cases[f"1b_pipeline_{name}"] = run_case(case_pipeline, collection)
+            cases[f"1b_pipeline_lexical_ivf_{name}"] = run_case(
+                case_pipeline, collection, {"lexical_depth": 50, "index_kind": "ivf"})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sys.path.insert(0, BENCH_DIR)
+        from synthetic import make_pdf, make_collection
+        for pages in synthetic_pages:
+            path = os.path.join(tmp, f"synthetic_{pages}.pdf")
+            truth = make_pdf(path, pages)
+            cases[f"1a_outline_synthetic_{pages}p"] = run_case(case_outline, [path], {path: truth})
+            cases[f"1b_sections_synthetic_{pages}p"] = run_case(case_sections, [path])
+            if not skip_pipeline:
+                collection = os.path.join(tmp, f"collection_{pages}p")
+                make_collection(collection, pages)
+                cases[f"1b_pipeline_synthetic_{pages}p"] = run_case(case_pipeline, collection)
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        "cases": cases,
+    }
+
+
+def print_report(results, baseline=None):
+    metrics = ["wall_time", "import_time", "pages_per_sec", "peak_rss_mb", "precision", "recall",
+               "title_accuracy", "section_overlap"]
+    for name, case in results["cases"].items():
+        print(name)
+        old = (baseline or {}).get("cases", {}).get(name, {})
+        for metric in metrics:
+            if metric not in case:
+                continue
+            line = f"  {metric:<16}{case[metric]:>12.3f}"
+            if metric in old and old[metric]:
+                line += f"  ({(case[metric] - old[metric]) / old[metric]:+.1%} vs {old[metric]:.3f})"
+            print(line)
+        if "sections_digest" in case and old.get("sections_digest", case["sections_digest"]) != case["sections_digest"]:
+            print(f"  sections        CHANGED ({old['sections_digest']} -> {case['sections_digest']})")
+        stages = ", ".join(f"{k}={v:.3f}s" for k, v in case.get("stages", {}).items())
+        print(f"  stages          {stages}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark both PDF pipelines.")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--compare", help="results JSON from an earlier run to compare against")
+    parser.add_argument("--synthetic-pages", type=int, nargs="*", default=[300],
+                        help="page counts of generated PDFs (none to skip)")
+    parser.add_argument("--skip-pipeline", action="store_true", help="skip the full 1b pipeline cases")
+    args = parser.parse_args(argv)
+
+    results = run_all(args.synthetic_pages, skip_pipeline=args.skip_pipeline)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
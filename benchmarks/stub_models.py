@@ -0,0 +1,60 @@
+"""
+Offline stand-ins for the sentence-transformers models so benchmarks run
+without network access or model downloads. Embeddings are deterministic
+hashed bag-of-words vectors, which keeps similarity roughly meaningful
+while costing almost nothing, so timings isolate the non-model stages.
+"""
+import sys
+import types
+import zlib
+import numpy as np
+
+DIM = 256
+
+
+def _embed(text):
+    vec = np.zeros(DIM, dtype=np.float32)
+    for word in text.lower().split():
+        vec[zlib.crc32(word.encode("utf-8")) % DIM] += 1.0
+    return vec
+
+
+class SentenceTransformer:
+    def __init__(self, model_name_or_path=None, **kwargs):
+        self.model_name = model_name_or_path
+
+    def encode(self, sentences, batch_size=32, convert_to_numpy=True, normalize_embeddings=False, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        out = np.stack([_embed(t) for t in texts]) if texts else np.zeros((0, DIM), np.float32)
+        if normalize_embeddings:
+            norms = np.linalg.norm(out, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            out = out / norms
+        return out[0] if single else out
+
+    def tokenize(self, texts):
+        return {"input_ids": [t.split() for t in texts]}
+
+
+class CrossEncoder:
+    def __init__(self, model_name, **kwargs):
+        self.model_name = model_name
+
+    def predict(self, sentences, **kwargs):
+        scores = []
+        for query, passage in sentences:
+            q, p = set(query.lower().split()), set(passage.lower().split())
+            scores.append(len(q & p) / (len(q) or 1))
+        return np.array(scores, dtype=np.float32)
+
+
+def install():
+    """
+    Registers the stub as the `sentence_transformers` module.
+    """
+    module = types.ModuleType("sentence_transformers")
+    module.SentenceTransformer = SentenceTransformer
+    module.CrossEncoder = CrossEncoder
+    module.util = types.SimpleNamespace()
+    sys.modules["sentence_transformers"] = module
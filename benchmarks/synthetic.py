@@ -0,0 +1,76 @@
+"""
+Generates large PDFs with a known outline for throughput and accuracy
+benchmarks.
+"""
+import os
+import json
+import random
+import fitz  # PyMuPDF
+
+# Body words avoid the title keywords in process_pdfs.py ("report", "plan",
+# "summary", ...) so body lines are not mistaken for the title
+WORDS = (
+    "analysis system data process review project budget market travel guide "
+    "city culture history design quality policy research team customer "
+    "service schedule resource network security training"
+).split()
+
+BODY_SIZE = 10
+H1_SIZE = 18
+H2_SIZE = 12
+
+
+def _sentence(rng, n):
+    return " ".join(rng.choice(WORDS) for _ in range(n)).capitalize() + "."
+
+
+def make_pdf(path, pages, seed=0, lines_per_page=40):
+    """
+    Writes a `pages`-page PDF to path and returns the outline it contains as
+    {"title": ..., "outline": [{"level", "text", "page"}, ...]}.
+    """
+    rng = random.Random(seed)
+    doc = fitz.open()
+    title = "Synthetic Benchmark Report"
+    outline = []
+    for page_num in range(1, pages + 1):
+        page = doc.new_page()
+        y = 60
+        if page_num == 1:
+            page.insert_text((72, y), title, fontsize=24, fontname="hebo")
+            y += 40
+        if page_num % 5 == 1:
+            text = f"Chapter {page_num // 5 + 1} {rng.choice(WORDS).title()} Overview"
+            page.insert_text((72, y), text, fontsize=H1_SIZE, fontname="hebo")
+            outline.append({"level": "H1", "text": text, "page": page_num})
+            y += 30
+        for line_no in range(lines_per_page):
+            if y > 760:
+                break
+            if line_no == lines_per_page // 2:
+                text = f"Part {page_num}.{line_no} {rng.choice(WORDS).title()}"
+                page.insert_text((72, y), text, fontsize=H2_SIZE, fontname="hebo")
+                outline.append({"level": "H2", "text": text, "page": page_num})
+                y += 20
+                continue
+            page.insert_text((72, y), _sentence(rng, 11).lower(), fontsize=BODY_SIZE, fontname="helv")
+            y += 14
+    doc.save(path)
+    doc.close()
+    return {"title": title, "outline": outline}
+
+
+def make_collection(collection_dir, pages, seed=0):
+    """
+    Writes a Challenge_1b collection around one `pages`-page PDF: PDFs/
+    plus a challenge1b_input.json whose job uses the body vocabulary.
+    """
+    os.makedirs(os.path.join(collection_dir, "PDFs"), exist_ok=True)
+    make_pdf(os.path.join(collection_dir, "PDFs", "synthetic.pdf"), pages, seed=seed)
+    input_data = {
+        "documents": [{"filename": "synthetic.pdf", "title": "Synthetic Benchmark Report"}],
+        "persona": {"role": "Project Manager"},
+        "job_to_be_done": {"task": "Review the budget, schedule and security of the network project."},
+    }
+    with open(os.path.join(collection_dir, "challenge1b_input.json"), "w", encoding="utf-8") as f:
+        json.dump(input_data, f, indent=2)